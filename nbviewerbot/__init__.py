@@ -1,4 +1,12 @@
 from nbviewerbot import resources
+from nbviewerbot import hosts
 from nbviewerbot import utils
 from nbviewerbot import templating
+from nbviewerbot import resolver
+from nbviewerbot import accounts
+from nbviewerbot import monitor
+from nbviewerbot import stats
+from nbviewerbot import control
+from nbviewerbot import pending
+from nbviewerbot import threadcache
 from nbviewerbot.nbviewerbot import *
@@ -0,0 +1,158 @@
+"""Spread replies over a pool of Reddit accounts"""
+
+import time
+import threading
+import zlib
+from collections import namedtuple
+
+import praw.models
+
+from nbviewerbot import resources, utils
+
+
+Account = namedtuple("Account", ["reddit", "username", "bucket"])
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket rate limiter.
+
+    Parameters
+    ----------
+    rate : float
+        Tokens added per second
+    capacity : int
+        Maximum number of tokens in the bucket (the allowed burst)
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Add the tokens accrued since the last update. Call with
+        self._lock held."""
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, block=True):
+        """
+        Take a token from the bucket.
+
+        Parameters
+        ----------
+        block : bool
+            Wait until a token is available, rather than giving up
+
+        Returns
+        -------
+        bool : whether a token was taken
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if not block:
+                return False
+            time.sleep(wait)
+
+    def time_to_token(self):
+        """Seconds until a token is available (0 if one is available now)"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class ReplyPool:
+    """
+    A pool of Reddit accounts to post replies from, each with its own rate
+    limit. All replies within a thread (submission) are pinned to the same
+    account, so that the accounts never compete over the same thread.
+
+    A pool of a single account isn't rate limited here, and leaves that to
+    Reddit (see post_reply's backoff) as before there were pools.
+
+    Parameters
+    ----------
+    reddits : list[praw.Reddit]
+        Authenticated Reddit clients, one per account
+    rate : float
+        Replies per second allowed for each account
+    burst : int
+        Number of replies each account may post in quick succession
+    """
+
+    def __init__(
+        self, reddits, rate=resources.REPLY_RATE, burst=resources.REPLY_BURST
+    ):
+        if not reddits:
+            raise ValueError("At least one Reddit account is required")
+
+        limited = len(reddits) > 1
+        self.accounts = [
+            Account(
+                reddit,
+                reddit.user.me().name,
+                TokenBucket(rate, burst) if limited else None,
+            )
+            for reddit in reddits
+        ]
+        self.usernames = {a.username.lower() for a in self.accounts}
+
+    def account_for(self, praw_obj):
+        """Return the Account pinned to the thread of a praw object"""
+        thread_id = utils.praw_object_thread_id(praw_obj)
+        index = zlib.crc32(thread_id.encode()) % len(self.accounts)
+        return self.accounts[index]
+
+    def acquire(self, praw_obj, block=True):
+        """
+        Wait for the account pinned to the thread of a praw object to be
+        allowed to reply, and return the object as seen by that account.
+
+        Parameters
+        ----------
+        praw_obj : Comment or Submission
+        block : bool
+            Wait for the account's rate limit, rather than giving up
+
+        Returns
+        -------
+        Comment or Submission or None : the object to reply to, or None if
+        block is False and the account can't reply yet (see time_to_reply)
+        """
+        account = self.account_for(praw_obj)
+        if account.bucket is not None and not account.bucket.acquire(
+            block=False
+        ):
+            if not block:
+                return None
+            resources.LOGGER.info(
+                "Reply rate limit reached for {}, waiting".format(
+                    account.username
+                )
+            )
+            account.bucket.acquire()
+
+        if isinstance(praw_obj, praw.models.Comment):
+            return account.reddit.comment(id=praw_obj.id)
+        elif isinstance(praw_obj, praw.models.Submission):
+            return account.reddit.submission(id=praw_obj.id)
+        else:
+            raise TypeError("praw_obj should be a Comment or Submission")
+
+    def time_to_reply(self, praw_obj):
+        """Seconds until the account pinned to the thread of a praw object
+        may reply"""
+        bucket = self.account_for(praw_obj).bucket
+        return bucket.time_to_token() if bucket is not None else 0.0
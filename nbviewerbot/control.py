@@ -0,0 +1,199 @@
+"""Run nbviewerbot in the background and control it over a Unix socket"""
+
+import os
+import sys
+import json
+import errno
+import atexit
+import socket
+import socketserver
+import threading
+import time
+
+from nbviewerbot import resources, utils
+
+
+class BotNotRunning(Exception):
+    """Raised when there is no running nbviewerbot to talk to"""
+
+
+def read_pid(pidfile):
+    """Return the pid in pidfile, or None if it doesn't exist or belongs to
+    a process that is no longer running"""
+    try:
+        with open(pidfile, "r") as h:
+            pid = int(h.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass  # running, but as another user
+    return pid
+
+
+def daemonize(pidfile):
+    """
+    Detach the current process from the terminal (double fork), and record
+    the pid of the detached process in pidfile. Only the detached process
+    returns from this function. The pidfile is removed when it exits.
+
+    The pidfile is created exclusively before forking, so of two processes
+    started at the same time only one gets to detach.
+
+    Raises
+    ------
+    RuntimeError : if the pidfile belongs to a running process
+    """
+    pid_fd = _create_pidfile(pidfile)
+
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+    with os.fdopen(pid_fd, "w") as h:
+        h.write(str(os.getpid()))
+    atexit.register(utils.remove_file, pidfile)
+
+
+def _create_pidfile(pidfile):
+    """Create pidfile exclusively, replacing a stale one, and return its
+    file descriptor. Raise RuntimeError if it belongs to a running
+    process."""
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+    try:
+        return os.open(pidfile, flags, 0o644)
+    except FileExistsError:
+        pass
+
+    try:
+        stat = os.stat(pidfile)
+    except FileNotFoundError:
+        stat = None
+    if stat is not None and stat.st_size == 0:
+        # created by another start that hasn't written its pid yet
+        if time.time() - stat.st_mtime < resources.PIDFILE_START_TIMEOUT:
+            raise RuntimeError("nbviewerbot is already starting")
+
+    pid = read_pid(pidfile)
+    if pid is not None:
+        raise RuntimeError(
+            "nbviewerbot is already running (pid {})".format(pid)
+        )
+    utils.remove_file(pidfile)  # left behind by a bot that didn't exit cleanly
+    try:
+        return os.open(pidfile, flags, 0o644)
+    except FileExistsError:
+        raise RuntimeError("nbviewerbot is already starting")
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    """Reads a single command line and writes back a JSON response line"""
+
+    def handle(self):
+        command = self.rfile.readline().decode().strip()
+        handler = self.server.commands.get(command)
+        if handler is None:
+            response = {"error": "Unknown command {!r}".format(command)}
+        else:
+            try:
+                response = handler()
+            except Exception as e:
+                resources.LOGGER.exception("Error handling command")
+                response = {"error": str(e)}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class ControlServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    """
+    Serve commands on a Unix socket from a background thread.
+
+    Parameters
+    ----------
+    path : str
+        Path of the socket
+    commands : dict[str, callable]
+        Functions returning a JSON-serializable response, by command name
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, commands):
+        self.path = path
+        self.commands = commands
+
+        if os.path.exists(path):
+            try:
+                send_command(path, "ping")
+            except BotNotRunning:
+                os.remove(path)  # left over from a crashed bot
+            else:
+                raise RuntimeError(
+                    "nbviewerbot is already running (socket {})".format(path)
+                )
+
+        super().__init__(path, _CommandHandler)
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="ControlServer", daemon=True
+        )
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._thread.start()
+        resources.LOGGER.info("Listening for commands on {}".format(self.path))
+
+    def close(self):
+        """Stop serving and remove the socket"""
+        self.shutdown()
+        self.server_close()
+        utils.remove_file(self.path)
+
+
+def send_command(path, command, timeout=5.0):
+    """
+    Send a command to a running nbviewerbot.
+
+    Parameters
+    ----------
+    path : str
+        Path of the bot's control socket
+    command : str
+    timeout : float
+
+    Returns
+    -------
+    dict : the bot's response
+
+    Raises
+    ------
+    BotNotRunning : if there is no bot listening on path
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(path)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                raise BotNotRunning("No nbviewerbot listening on " + path)
+            raise
+
+        sock.sendall(command.encode() + b"\n")
+        with sock.makefile("rb") as h:
+            return json.loads(h.readline().decode())
+    finally:
+        sock.close()
@@ -0,0 +1,120 @@
+"""Registry of the sites hosting notebooks that nbviewerbot understands"""
+
+import re
+import urllib.parse
+from collections import namedtuple
+
+
+# How to handle links to notebooks on a host:
+# * matcher : compiled regex matching the path of a link to a notebook, with
+#   the groups repo, branch (optional) and filepath (optional)
+# * nbviewer_path : function(netloc, path, groups) -> str, the path
+#   (starting with the host) of the notebook for nbviewer's /url/ endpoint
+# * binder_spec : function(repo) -> (provider, spec), the binder repository
+#   provider and repository spec for the repo matched by matcher
+NotebookHost = namedtuple(
+    "NotebookHost", ["matcher", "nbviewer_path", "binder_spec"]
+)
+
+# Hosts by lowercase netloc (without "www.")
+HOSTS = {}
+
+
+def register(netlocs, host):
+    """
+    Add a NotebookHost to the registry.
+
+    Parameters
+    ----------
+    netlocs : str or list[str]
+        The lowercase network locations (without "www.") the host serves
+    host : NotebookHost
+    """
+    if type(netlocs) is str:
+        netlocs = [netlocs]
+    for netloc in netlocs:
+        HOSTS[netloc] = host
+
+
+def get_host(netloc):
+    """Return the NotebookHost for a netloc, or None if there is none"""
+    return HOSTS.get(netloc)
+
+
+def _matcher(rx):
+    """Compile a path regex, only matching paths that mention a notebook"""
+    return re.compile(r"(?=.*\.ipynb)" + rx, re.IGNORECASE)
+
+
+def _same_path(netloc, path, groups):
+    """nbviewer path for hosts whose notebook URLs nbviewer renders as is"""
+    return netloc + path
+
+
+register(
+    "github.com",
+    NotebookHost(
+        matcher=_matcher(
+            r"/(?P<repo>[^/]+/[^/]+)"
+            r"(?:/[^/]+/(?P<branch>[^/]+)(?:/(?P<filepath>.+))?)?"
+        ),
+        nbviewer_path=_same_path,
+        binder_spec=lambda repo: ("gh", repo),
+    ),
+)
+
+register(
+    "raw.githubusercontent.com",
+    NotebookHost(
+        matcher=_matcher(
+            r"/(?P<repo>[^/]+/[^/]+)/(?P<branch>[^/]+)/(?P<filepath>.+)"
+        ),
+        nbviewer_path=_same_path,
+        binder_spec=lambda repo: ("gh", repo),
+    ),
+)
+
+register(
+    ["gist.github.com", "gist.githubusercontent.com"],
+    NotebookHost(
+        matcher=_matcher(
+            r"/(?P<repo>[^/]+/[^/]+)"
+            r"(?:/raw(?:/(?P<branch>[0-9a-f]{40}))?/(?P<filepath>.+))?"
+        ),
+        nbviewer_path=_same_path,
+        binder_spec=lambda repo: ("gist", repo),
+    ),
+)
+
+register(
+    "gitlab.com",
+    NotebookHost(
+        # repos can be nested in (sub)groups: group/subgroup/repo
+        matcher=_matcher(
+            r"/(?P<repo>[^/]+(?:/[^/]+)+?)(?:/-)?/(?:blob|raw)"
+            r"/(?P<branch>[^/]+)/(?P<filepath>.+)"
+        ),
+        nbviewer_path=lambda netloc, path, groups: "{}/{}/-/raw/{}/{}".format(
+            netloc, groups["repo"], groups["branch"], groups["filepath"]
+        ),
+        binder_spec=lambda repo: ("gl", urllib.parse.quote(repo, safe="")),
+    ),
+)
+
+register(
+    "bitbucket.org",
+    NotebookHost(
+        matcher=_matcher(
+            r"/(?P<repo>[^/]+/[^/]+)/(?:src|raw)"
+            r"/(?P<branch>[^/]+)/(?P<filepath>.+)"
+        ),
+        nbviewer_path=lambda netloc, path, groups: "{}/{}/raw/{}/{}".format(
+            netloc, groups["repo"], groups["branch"], groups["filepath"]
+        ),
+        # binder has no bitbucket provider, use the generic git one
+        binder_spec=lambda repo: (
+            "git",
+            urllib.parse.quote("https://bitbucket.org/" + repo, safe=""),
+        ),
+    ),
+)
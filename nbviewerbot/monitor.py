@@ -0,0 +1,209 @@
+"""Track stream health and reply latency"""
+
+import time
+import threading
+from collections import deque
+
+from nbviewerbot import resources
+
+
+class StreamMonitor:
+    """
+    Keep track of the items arriving on a stream, and recreate the stream
+    when it has been quiet for much longer than usual.
+
+    The typical time between items is tracked as an exponentially weighted
+    moving average. A stream counts as stalled when no item has arrived
+    for stall_factor times that long (and at least min_quiet seconds).
+
+    Parameters
+    ----------
+    name : str
+        The name of the stream, for logging
+    factory : callable
+        Returns a new instance of the stream
+    stall_factor : float
+        How many typical inter-arrival times a stream may be quiet
+    min_quiet : float
+        Minimum number of quiet seconds before a stream counts as stalled
+    min_items : int
+        Number of items to see before judging the stream at all
+    """
+
+    # weight of the latest inter-arrival time in the moving average
+    ALPHA = 0.1
+
+    def __init__(
+        self,
+        name,
+        factory,
+        stall_factor=resources.STREAM_STALL_FACTOR,
+        min_quiet=resources.STREAM_STALL_MIN_QUIET,
+        min_items=10,
+    ):
+        self.name = name
+        self.factory = factory
+        self.stall_factor = stall_factor
+        self.min_quiet = min_quiet
+        self.min_items = min_items
+
+        self.items = 0
+        self.restarts = 0
+        self.started = time.time()
+        self.last_item = None
+        self.mean_interval = None
+        self._restart = threading.Event()
+
+    def record_item(self, now=None):
+        """Register the arrival of an item"""
+        now = time.time() if now is None else now
+        if self.last_item is not None:
+            interval = now - self.last_item
+            if self.mean_interval is None:
+                self.mean_interval = interval
+            else:
+                self.mean_interval += self.ALPHA * (
+                    interval - self.mean_interval
+                )
+        self.last_item = now
+        self.items += 1
+
+    def quiet_for(self, now=None):
+        """Seconds since the last item (or since the start, if none yet)"""
+        now = time.time() if now is None else now
+        return now - (self.last_item or self.started)
+
+    def rate(self):
+        """Typical number of items per second, or None if unknown"""
+        if not self.mean_interval:
+            return None
+        return 1 / self.mean_interval
+
+    def is_stalled(self, now=None):
+        """Whether the stream has been quiet for much longer than usual"""
+        if self.items < self.min_items or self.mean_interval is None:
+            return False
+        limit = max(self.min_quiet, self.stall_factor * self.mean_interval)
+        return self.quiet_for(now) > limit
+
+    def request_restart(self):
+        """Ask the stream's consumer to recreate the stream"""
+        self._restart.set()
+
+    def restart_requested(self):
+        return self._restart.is_set()
+
+    def restart(self):
+        """Create a new instance of the stream and reset the quiet timer"""
+        self._restart.clear()
+        self.restarts += 1
+        self.last_item = time.time()
+        resources.LOGGER.warning("Recreating stream {}".format(self.name))
+        return self.factory()
+
+
+def watchdog(monitors, stop_event, interval=resources.WATCHDOG_INTERVAL):
+    """
+    Check the monitored streams every interval seconds, and request a
+    restart of those that have stalled. Stops when stop_event is set.
+
+    Parameters
+    ----------
+    monitors : list[StreamMonitor]
+    stop_event : Event
+    interval : float
+    """
+    while not stop_event.wait(interval):
+        for monitor in monitors:
+            if monitor.is_stalled() and not monitor.restart_requested():
+                resources.LOGGER.warning(
+                    "Stream {} stalled, no items for {:.0f}s".format(
+                        monitor.name, monitor.quiet_for()
+                    )
+                )
+                monitor.request_restart()
+
+
+class LatencyTracker:
+    """
+    Rolling record of the latency of our replies: from the creation of a
+    comment or submission, via its ingestion from a stream, to our reply.
+
+    Parameters
+    ----------
+    maxlen : int
+        Number of most recent replies to keep
+    slo : float
+        Target creation-to-reply latency in seconds. Slower replies are
+        logged as warnings.
+    """
+
+    def __init__(
+        self, maxlen=resources.LATENCY_WINDOW, slo=resources.REPLY_LATENCY_SLO
+    ):
+        self.slo = slo
+        self.last_reply = None
+        self._latencies = deque(maxlen=maxlen)  # (ingest, total) pairs
+        self._lock = threading.Lock()
+
+    def record(self, created, ingested, replied=None):
+        """
+        Record the timestamps of a reply.
+
+        Parameters
+        ----------
+        created : float
+            When the replied-to object was created (its created_utc)
+        ingested : float
+            When the object was read from its stream
+        replied : float, optional
+            When the reply was posted, default now
+        """
+        replied = time.time() if replied is None else replied
+        latency = replied - created
+        with self._lock:
+            self._latencies.append((ingested - created, latency))
+            self.last_reply = replied
+
+        if latency > self.slo:
+            resources.LOGGER.warning(
+                "Reply latency {:.0f}s exceeds SLO of {:.0f}s".format(
+                    latency, self.slo
+                )
+            )
+
+    def summary(self):
+        """
+        Summarize the recorded latencies.
+
+        Returns
+        -------
+        dict : number of replies, median, 95th percentile and max
+        creation-to-reply latency, median ingest latency, and the fraction
+        of replies within the SLO. Latencies are None if there are no
+        replies yet.
+        """
+        with self._lock:
+            ingest = sorted(i for i, _ in self._latencies)
+            total = sorted(t for _, t in self._latencies)
+
+        summary = {
+            "replies": len(total),
+            "p50": _percentile(total, 50),
+            "p95": _percentile(total, 95),
+            "max": total[-1] if total else None,
+            "ingest_p50": _percentile(ingest, 50),
+            "within_slo": None,
+        }
+        if total:
+            within = sum(1 for t in total if t <= self.slo)
+            summary["within_slo"] = within / len(total)
+        return summary
+
+
+def _percentile(values, p):
+    """Nearest-rank percentile of sorted values, or None if empty"""
+    if not values:
+        return None
+    index = max(0, int(round(p / 100 * len(values))) - 1)
+    return values[index]
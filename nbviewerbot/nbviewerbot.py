@@ -1,5 +1,15 @@
+import os
+import json
+import collections
 import logging
 import atexit
+import datetime
+import functools
+import heapq
+import itertools
+import signal
+import threading
+import time
 from pprint import pformat
 import multiprocessing.dummy as mp
 import queue
@@ -13,6 +23,15 @@ import prawcore.exceptions
 import dotenv
 
 from nbviewerbot import resources, utils, templating
+from nbviewerbot.accounts import ReplyPool
+from nbviewerbot.control import ControlServer, BotNotRunning
+from nbviewerbot.control import daemonize, send_command
+from nbviewerbot.pending import PendingWork, stream_scope
+from nbviewerbot.monitor import StreamMonitor, LatencyTracker, watchdog
+from nbviewerbot.resolver import NotebookResolver
+from nbviewerbot.stats import SubredditStats, SubredditFilter
+from nbviewerbot.stats import COUNTERS, HOT, FAST, SLOW, DROPPED
+from nbviewerbot.threadcache import ThreadCache
 
 
 # Exceptions that we will retry on
@@ -24,39 +43,147 @@ _PRAW_EXCEPTIONS = (
 )
 
 
-def get_streams(subreddits):
-    """Return the comment and submission streams for a subreddit or list of
-    subreddit names"""
+def get_stream_factories(subreddits, reddit=None):
+    """Return functions that create the comment and submission streams for a
+    subreddit or list of subreddit names"""
     if type(subreddits) is str:
         subreddits = [subreddits]
 
-    reddit = resources.load_reddit()
+    if reddit is None:
+        reddit = resources.load_reddit()
     subreddit_str = "+".join(subreddits)
     sub = reddit.subreddit(subreddit_str)
 
     resources.LOGGER.info("Streaming comments from {}".format(subreddit_str))
 
     return (
-        sub.stream.comments(pause_after=2),
-        sub.stream.submissions(pause_after=2),
+        functools.partial(sub.stream.comments, pause_after=2),
+        functools.partial(sub.stream.submissions, pause_after=2),
     )
 
 
+def get_streams(subreddits, reddit=None):
+    """Return the comment and submission streams for a subreddit or list of
+    subreddit names"""
+    return tuple(f() for f in get_stream_factories(subreddits, reddit))
+
+
+# Names of the (comment, submission) streams of each scheduling tier
+TIER_STREAMS = {
+    HOT: ("HotComment", "HotSubmission"),
+    FAST: ("Comment", "Submission"),
+    SLOW: ("SlowComment", "SlowSubmission"),
+}
+
+
+def get_scheduled_stream_factories(
+    subreddits, reddit, stats, stop_event=None, tiers=None
+):
+    """
+    Return functions creating named streams for subreddits, scheduled by
+    their stats. High yield subreddits get dedicated streams, so that busy
+    subreddits can't crowd their items out of the stream listings. Those
+    without enough data yet (and average ones) share the regular streams,
+    low yield subreddits are polled up to every
+    resources.SLOW_STREAM_INTERVAL seconds on separate streams (more often
+    if they are busy, see utils.throttle_stream), and subreddits that have
+    banned the bot are dropped.
+
+    Parameters
+    ----------
+    subreddits : list[str]
+    reddit : praw.Reddit
+    stats : stats.SubredditStats
+    stop_event : Event, optional
+        Interrupts the wait between polls of the slow streams
+    tiers : dict, optional
+        The result of stats.schedule(subreddits), if already computed
+
+    Returns
+    -------
+    dict[str, callable] : the stream factories, by name (see TIER_STREAMS)
+    """
+    if tiers is None:
+        tiers = stats.schedule(subreddits)
+    if tiers[DROPPED]:
+        resources.LOGGER.warning(
+            "Dropping subreddits that banned us: {}".format(
+                ", ".join(tiers[DROPPED])
+            )
+        )
+
+    factories = {}
+    for tier in [HOT, FAST]:
+        if tiers[tier]:
+            factories.update(
+                zip(
+                    TIER_STREAMS[tier],
+                    get_stream_factories(tiers[tier], reddit),
+                )
+            )
+
+    if tiers[SLOW]:
+        interval = resources.SLOW_STREAM_INTERVAL
+        for name, factory in zip(
+            TIER_STREAMS[SLOW],
+            get_stream_factories(tiers[SLOW], reddit),
+        ):
+            factories[name] = functools.partial(
+                _throttled, factory, interval, stop_event, name
+            )
+
+    if not factories:
+        raise ValueError("All subreddits have been dropped")
+
+    return factories
+
+
+def _throttled(factory, interval, stop_event, name):
+    """Create a stream with factory and throttle it"""
+    return utils.throttle_stream(factory(), interval, stop_event, name=name)
+
+
+# State of the backoff in post_reply, for status reports
+BACKOFF_STATE = {"backing_off": False}
+
+
+def _on_backoff(details):
+    resources.LOGGER.warning(
+        "Exception replying to comment {}, sleeping. Details: {}".format(
+            details["args"][0].id, str(details)
+        )
+    )
+    BACKOFF_STATE.update(
+        backing_off=True,
+        target=details["args"][0].id,
+        tries=details["tries"],
+        wait=details["wait"],
+        since=time.time(),
+    )
+
+
+def _on_giveup(details):
+    resources.LOGGER.exception(
+        "Max retries reached, giving up on comment {}. Details: {}".format(
+            details["args"][0].id, str(details)
+        )
+    )
+    _reset_backoff_state(details)
+
+
+def _reset_backoff_state(details):
+    BACKOFF_STATE.clear()
+    BACKOFF_STATE["backing_off"] = False
+
+
 @backoff.on_exception(
     backoff.expo,
     exception=_PRAW_EXCEPTIONS,
     max_tries=5,
-    on_backoff=lambda x: resources.LOGGER.warning(
-        "Exception replying to comment {}, sleeping. Details: {}".format(
-            x["args"][0].id, str(x)
-        )
-    ),
+    on_backoff=_on_backoff,
+    on_success=_reset_backoff_state,
     giveup=lambda e: isinstance(e, prawcore.exceptions.Forbidden),
-    on_giveup=lambda x: resources.LOGGER.exception(
-        "Max retries reached, giving up on comment {}. Details: {}".format(
-            x["args"][0].id, str(x)
-        )
-    ),
+    on_giveup=_on_giveup,
 )
 def post_reply(praw_obj, text):
     """Reply to a comment or submisson with text. Will back off on
@@ -74,20 +201,31 @@ def post_reply(praw_obj, text):
     return reply
 
 
-def already_replied(praw_obj, username):
+def already_replied(praw_obj, username, thread_cache=None):
     """
     Check if a user has replied to an object
 
     Parameters
     ----------
     praw_obj (Comment or Submission): The object in question
-    username (str): The username to check
+    username (str or collection of str): The username(s) to check
+    thread_cache (ThreadCache, optional): Cache of the comment trees of
+        threads, checked before fetching the replies of the object itself
 
     Returns
     -------
     bool
 
     """
+    if type(username) is str:
+        username = [username]
+    usernames = {name.lower() for name in username}
+
+    if thread_cache is not None:
+        repliers = thread_cache.repliers(praw_obj)
+        if repliers is not None:
+            return not usernames.isdisjoint(repliers)
+
     if isinstance(praw_obj, praw.models.Comment):
         try:
             praw_obj.refresh()  # https://github.com/praw-dev/praw/issues/413
@@ -105,47 +243,180 @@ def already_replied(praw_obj, username):
             # Probably deleted account
             continue
 
-        if r.author.name.lower() == username.lower():
+        if r.author.name.lower() in usernames:
             return True
 
     return False
 
 
-def process_praw_object(praw_obj, username):
+def process_praw_object(
+    praw_obj,
+    username,
+    resolver=None,
+    stats=None,
+    pool=None,
+    subreddit_filter=None,
+    thread_cache=None,
+):
     """Check a praw object for Jupyter GitHub links and reply if
-    haven't already."""
+    haven't already. If a NotebookResolver is given, links to missing or
+    small notebooks are ignored. If SubredditStats are given, the outcome
+    is recorded in them. If a ReplyPool is given, the reply is posted from
+    one of its accounts (and username should be all of their names). If a
+    SubredditFilter is given, subreddits that refuse our reply are blocked
+    in it. If a ThreadCache is given, it is used to check for earlier
+    replies, and our reply is added to it.
+
+    Returns the posted reply, if any."""
     logger = resources.LOGGER
     obj_type = utils.praw_object_type(praw_obj)
     obj_id = praw_obj.id
 
     logger.debug("Processing {} {}".format(obj_type, obj_id))
 
+    def record(counter):
+        if stats is not None:
+            stats.record(utils.praw_object_subreddit(praw_obj), counter)
+
+    record("seen")
+
     jupy_links = []
     if isinstance(praw_obj, praw.models.Comment):
         jupy_links = utils.get_comment_jupyter_links(praw_obj)
     elif isinstance(praw_obj, praw.models.Submission):
         jupy_links = utils.get_submission_jupyter_links(praw_obj)
 
+    if jupy_links and resolver is not None:
+        jupy_links = resolver.filter_links(jupy_links)
+
     if jupy_links:
+        record("hits")
+
         # don't reply to comments more than once
-        if already_replied(praw_obj, username):
+        if already_replied(praw_obj, username, thread_cache):
             logger.info(
                 "Skipping {} {}, already replied".format(obj_type, obj_id)
             )
-            return
+            return None
 
         logger.info("Found Jupyter link(s) in {} {}".format(obj_type, obj_id))
         reply_text = templating.comment(jupy_links)
+        return send_reply(
+            praw_obj,
+            reply_text,
+            username,
+            stats,
+            pool,
+            subreddit_filter,
+            thread_cache,
+        )
+
+    return None
+
+
+class ReplyDeferred(Exception):
+    """
+    Raised instead of waiting when the account to reply from is rate
+    limited. The reply can be posted after wait seconds with send_reply.
+    """
+
+    def __init__(self, text, wait):
+        super().__init__("Reply deferred for {:.1f}s".format(wait))
+        self.text = text
+        self.wait = wait
+
+
+def send_reply(
+    praw_obj,
+    text,
+    username,
+    stats=None,
+    pool=None,
+    subreddit_filter=None,
+    thread_cache=None,
+):
+    """Post a reply to a praw object, see process_praw_object. If a
+    ReplyPool is given and the account pinned to the object's thread is
+    rate limited, raises ReplyDeferred rather than waiting, so that
+    replies from the other accounts aren't held up.
+
+    Returns the posted reply, if any."""
+    target = praw_obj
+    poster = username
+    if pool is not None:
+        target = pool.acquire(praw_obj, block=False)
+        if target is None:
+            raise ReplyDeferred(text, pool.time_to_reply(praw_obj))
+        poster = pool.account_for(praw_obj).username
+
+    def record(counter):
+        if stats is not None:
+            stats.record(utils.praw_object_subreddit(praw_obj), counter)
+
+    # use function for posting comment to catch rate limit exceptions
+    try:
+        reply = post_reply(target, text)
+    except prawcore.exceptions.Forbidden:
+        # Don't crash if we get banned from a sub
+        record("forbidden")
+        if subreddit_filter is not None:
+            subreddit_filter.block(utils.praw_object_subreddit(praw_obj))
+        return None
+
+    record("replies")
+    if thread_cache is not None:
+        thread_cache.add_reply(praw_obj, poster)
+    return reply
 
-        # use function for posting comment to catch rate limit exceptions
-        try:
-            post_reply(praw_obj, reply_text)
-        except prawcore.exceptions.Forbidden:
-            # Don't crash if we get banned from a sub
-            return
 
+def get_status(
+    main_queue,
+    workers,
+    monitors,
+    latency,
+    subreddit_filter,
+    thread_cache,
+    deferred=(),
+):
+    """
+    Collect runtime stats of a running bot, see main.
 
-def main(subreddits):
+    Returns
+    -------
+    dict : JSON-serializable status report
+    """
+    return {
+        "pid": os.getpid(),
+        "queue_depth": main_queue.qsize(),
+        "deferred_replies": len(deferred),
+        "streams": {
+            m.name: {
+                "items": m.items,
+                "items_per_second": m.rate(),
+                "quiet_for": m.quiet_for(),
+                "restarts": m.restarts,
+            }
+            for m in monitors
+        },
+        "workers": {w.name: w.is_alive() for w in workers},
+        "last_reply": latency.last_reply,
+        "reply_latency": latency.summary(),
+        "backoff": dict(BACKOFF_STATE),
+        "parse_limits_hit": dict(utils.PARSE_LIMITS_HIT),
+        "blocked_subreddits": sorted(subreddit_filter.blocked),
+        "thread_cache": thread_cache.summary(),
+    }
+
+
+def main(
+    subreddits,
+    resolver=None,
+    stats=None,
+    firehose=False,
+    control_path=resources.CONTROL_SOCKET_PATH,
+    pending_path=resources.PENDING_PATH,
+    shutdown_deadline=resources.SHUTDOWN_DEADLINE,
+):
     """
     Get comment stream for subreddits and process them. Will continue
     until interrupted.
@@ -154,64 +425,352 @@ def main(subreddits):
     ----------
     subreddits : list[str]
         The subreddits to process comments from
+    resolver : NotebookResolver, optional
+        Used to skip replying to missing or small notebooks
+    stats : SubredditStats, optional
+        Records per-subreddit counters, and schedules the subreddits'
+        streams based on them. Subreddits that have banned the bot are
+        skipped.
+    firehose : bool
+        Stream /r/all once and filter for subreddits locally, rather than
+        streaming from the subreddits directly
+    control_path : str or None
+        Path of the Unix socket to serve status and stop commands on, see
+        control.ControlServer. If None, no commands are served.
+    pending_path : str or None
+        File to save unprocessed items to on shutdown, and to resume them
+        from on start (see pending.PendingWork). If None, unprocessed items
+        are dropped.
+    shutdown_deadline : float
+        Seconds to keep processing queued items after stopping the streams,
+        before saving the rest to pending_path
 
     """
 
     logger = resources.LOGGER
 
-    reddit = resources.load_reddit()
-    username = reddit.user.me().name
-    comments, submissions = get_streams(subreddits)
+    pool = ReplyPool(resources.load_reddits())
+    reddit = pool.accounts[0].reddit
+    usernames = pool.usernames
 
     main_queue = mp.Queue(1024)
     stop_event = mp.Event()  # for stopping workers
 
+    # filter items in the stream workers, before they're queued
+    subreddit_filter = SubredditFilter(
+        blocked=stats.banned() if stats is not None else ()
+    )
+    if firehose and subreddits != resources.SUBREDDITS_ALL:
+        subreddit_filter = SubredditFilter(subreddits, subreddit_filter.blocked)
+        subreddits = resources.SUBREDDITS_ALL
+
+    if stats is not None and not firehose:
+        tiers = stats.schedule(subreddits)
+        factories = get_scheduled_stream_factories(
+            subreddits, reddit, stats, stop_event, tiers
+        )
+        stream_subreddits = {
+            name: tiers[tier]
+            for tier, names in TIER_STREAMS.items()
+            for name in names
+        }
+    else:
+        comments, submissions = get_stream_factories(subreddits, reddit)
+        factories = {"Comment": comments, "Submission": submissions}
+        stream_subreddits = dict.fromkeys(factories, subreddits)
+
+    if stats is not None:
+        atexit.register(stats.flush)
+    if resolver is not None:
+        atexit.register(resolver.flush)
+
+    # pick up the work left over by the previous run
+    pending = PendingWork()
+    if pending_path is not None:
+        pending = PendingWork.load(reddit, pending_path)
+    # a stream's position only carries over to a stream of the same
+    # subreddits
+    pending.set_scopes(
+        {
+            name: stream_scope(stream_subreddits[name])
+            for name in factories
+        }
+    )
+    backlog = collections.deque(
+        item
+        for item in pending.items
+        if subreddit_filter.accepts(utils.praw_object_subreddit(item.obj))
+    )
+
     # save the reply dict when the script exits
     atexit.register(lambda: logger.info("Exited nbviewerbot"))
 
     # create workers to add praw objects to the queue
     workers = []
-    comments_worker = mp.DummyProcess(
-        name="CommentWorker",
-        target=utils.load_queue,
-        args=(main_queue, comments, stop_event),
-    )
-    workers.append(comments_worker)
-
-    submissions_worker = mp.DummyProcess(
-        name="SubmissionWorker",
-        target=utils.load_queue,
-        args=(main_queue, submissions, stop_event),
+    monitors = []
+    for name, factory in factories.items():
+        monitor = StreamMonitor(name, factory)
+        monitors.append(monitor)
+        stream = factory()
+        if name in pending.seen_until:
+            # the previous run got this far, skip the start of the backlog
+            stream = utils.skip_seen(
+                stream,
+                pending.seen_until[name],
+                pending.seen_last.get(name, ()),
+            )
+        worker = mp.DummyProcess(
+            name=name + "Worker",
+            target=utils.notify_exit,
+            args=(
+                main_queue,
+                utils.load_queue,
+                main_queue,
+                stream,
+                stop_event,
+                monitor,
+                subreddit_filter,
+            ),
+        )
+        workers.append(worker)
+
+    # recreate streams that stall
+    workers.append(
+        mp.DummyProcess(
+            name="Watchdog",
+            target=utils.notify_exit,
+            args=(main_queue, watchdog, monitors, stop_event),
+        )
     )
-    workers.append(submissions_worker)
+    # don't wait on workers blocked on a full queue when exiting
+    for worker in workers:
+        worker.daemon = True
+    latency = LatencyTracker()
+    thread_cache = ThreadCache()
+    # replies waiting for their account's rate limit, as a heap of
+    # (time ready, order, QueuedItem, reply text)
+    deferred = []
+    order = itertools.count()
+
+    def request_stop():
+        """Set stop_event, and wake up the main loop to notice it"""
+        stop_event.set()
+        try:
+            main_queue.put_nowait(utils.WAKE_UP)
+        except queue.Full:
+            pass  # the main loop will wake up for the next item anyway
+        return {"stopping": os.getpid()}
 
     # make sure workers end on main thread end
     atexit.register(lambda e: e.set(), stop_event)
 
+    if control_path is not None:
+        commands = {
+            "ping": lambda: {"ok": True},
+            "status": lambda: get_status(
+                main_queue,
+                workers,
+                monitors,
+                latency,
+                subreddit_filter,
+                thread_cache,
+                deferred,
+            ),
+            "stop": request_stop,
+        }
+        control_server = ControlServer(control_path, commands)
+        control_server.start()
+        atexit.register(control_server.close)
+
+    def handle(item, text=None):
+        """Process a queued item, or post its deferred reply text, and
+        record the latency of the reply"""
+        pending.mark_seen(item)
+        try:
+            if text is None:
+                reply = process_praw_object(
+                    item.obj,
+                    usernames,
+                    resolver,
+                    stats,
+                    pool,
+                    subreddit_filter,
+                    thread_cache,
+                )
+            else:
+                reply = send_reply(
+                    item.obj,
+                    text,
+                    usernames,
+                    stats,
+                    pool,
+                    subreddit_filter,
+                    thread_cache,
+                )
+        except ReplyDeferred as e:
+            logger.debug("Deferring reply to {}: {}".format(item.obj.id, e))
+            heapq.heappush(
+                deferred, (time.time() + e.wait, next(order), item, e.text)
+            )
+            return
+
+        if reply is not None:
+            latency.record(item.obj.created_utc, item.ingested)
+            summary = latency.summary()
+            if summary["replies"] % resources.LATENCY_REPORT_EVERY == 0:
+                logger.info(
+                    "Reply latency over last {replies} replies: "
+                    "p50 {p50:.0f}s, p95 {p95:.0f}s, max {max:.0f}s "
+                    "({within_slo:.0%} within SLO)".format(**summary)
+                )
+
+    def on_sigterm(signum, frame):
+        # request_stop takes the queue's lock, which the interrupted main
+        # thread may be holding, so call it from another thread
+        threading.Thread(target=request_stop, name="StopRequest").start()
+
+    # `kill <pid>` stops the bot like the stop command, draining the queue
+    # and saving the pending items
+    previous_sigterm = None
+    if threading.current_thread() is threading.main_thread():
+        previous_sigterm = signal.signal(signal.SIGTERM, on_sigterm)
+
     # let's get it started in here
     [w.start() for w in workers]
     logger.info("Started nbviewerbot, listening for new comments...")
 
-    while not stop_event.is_set():
+    # the workers notify the main loop of their exit through the queue
+    running = {w.name for w in workers}
+
+    try:
+        while not stop_event.is_set():
+            item = None
+            try:
+                wait = None  # block until an item arrives
+                if deferred:
+                    wait = deferred[0][0] - time.time()
+                if wait is not None and wait <= 0:
+                    _, _, item, text = heapq.heappop(deferred)
+                    handle(item, text)
+                else:
+                    if backlog:
+                        item = backlog.popleft()
+                    else:
+                        item = main_queue.get(timeout=wait)
+                    if isinstance(item, utils.QueuedItem):
+                        handle(item)
+            except queue.Empty:
+                pass  # time to post a deferred reply
+            except KeyboardInterrupt:
+                stop_event.set()
+                logger.warning("Stopping nbviewerbot...")
+                if isinstance(item, utils.QueuedItem):
+                    # interrupted mid-item, e.g. while backing off
+                    backlog.appendleft(item)
+            except:
+                stop_event.set()
+                logger.exception(
+                    "Uncaught exception on object, skipping. Details:"
+                )
+                raise
+
+            if isinstance(item, utils.WorkerExit):
+                running.discard(item.name)
+                if not stop_event.is_set():
+                    stop_event.set()
+                    raise InterruptedError(
+                        "{} died unexpectedly".format(item.name)
+                    )
+    finally:
+        stop_event.set()
+        if previous_sigterm is not None:
+            signal.signal(signal.SIGTERM, previous_sigterm)
+        drain(main_queue, backlog, running, handle, shutdown_deadline)
+        # deferred replies are looked into again from scratch next time
+        backlog.extend(item for _, _, item, _ in sorted(deferred))
+        pending.items = list(backlog)
+        # the saved items are resumed from the pending file, so the next
+        # run's streams can skip them along with the handled ones
+        for item in pending.items:
+            pending.mark_seen(item)
+        if pending_path is not None:
+            pending.save(pending_path)
+        elif pending.items:
+            logger.warning(
+                "Dropping {} unprocessed items".format(len(pending.items))
+            )
+
+
+def drain(main_queue, backlog, running, handle, deadline):
+    """
+    Finish the work in progress on shutdown. Keep handling items from the
+    backlog and the queue until all running workers have put their
+    utils.WorkerExit on the queue (after which they can't add any more
+    items) and the queue is empty, or until deadline seconds have passed. A second
+    KeyboardInterrupt also ends the drain.
+
+    Items left unhandled are moved from the queue to the end of backlog.
+
+    Parameters
+    ----------
+    main_queue : Queue
+        The queue filled by the workers
+    backlog : collections.deque
+        Items to handle before those in the queue
+    running : set[str]
+        Names of the workers that haven't exited yet, which should be
+        stopping
+    handle : callable
+        Handles a utils.QueuedItem from backlog or main_queue
+    deadline : float
+    """
+    logger = resources.LOGGER
+    end = time.time() + deadline
+    try:
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            if backlog:
+                item = backlog.popleft()
+            else:
+                try:
+                    if running:
+                        item = main_queue.get(timeout=remaining)
+                    else:
+                        item = main_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if isinstance(item, utils.WorkerExit):
+                running.discard(item.name)
+                continue
+            if not isinstance(item, utils.QueuedItem):
+                continue
+
+            try:
+                handle(item)
+            except KeyboardInterrupt:
+                backlog.appendleft(item)
+                raise
+            except Exception:
+                logger.exception("Uncaught exception while draining")
+                break
+    except KeyboardInterrupt:
+        logger.warning("Draining interrupted")
+
+    while True:
         try:
-            praw_obj = main_queue.get(timeout=1)
-            process_praw_object(praw_obj, username)
+            item = main_queue.get_nowait()
         except queue.Empty:
-            pass  # no problems, just nothing in the queue
-        except KeyboardInterrupt:
-            stop_event.set()
-            logger.warn("Stopping nbviewerbot...")
-        except:
-            stop_event.set()
-            logger.exception("Uncaught exception on object, skipping. Details:")
-            raise
+            break
+        if isinstance(item, utils.QueuedItem):
+            backlog.append(item)
 
-        if not all([w.is_alive() for w in workers]):
-            stop_event.set()
-            raise InterruptedError("Praw worker died unexpectedly")
+    if backlog:
+        logger.warning("{} items left unprocessed".format(len(backlog)))
 
 
-# TODO: Add --detach option and status/kill commands for background running
 @click.group(invoke_without_command=True)
 @click.pass_context
 @click.option(
@@ -246,9 +805,36 @@ def main(subreddits):
     type=click.Path(exists=True, allow_dash=True, resolve_path=True),
     help="A custom .env file for loading environment variables. "
     "Relevant vars: CLIENT_ID, CLIENT_SECRET, USERNAME, "
-    "PASSWORD.",
+    "PASSWORD (plus CLIENT_ID_2, ..., PASSWORD_2 etc. for additional "
+    "reply accounts), GITHUB_TOKEN (optional).",
 )
-def cli(ctx, verbose, quiet, subreddit_set, env):
+@click.option(
+    "--min-size",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Look up linked notebooks with the GitHub API and only reply to "
+    "those that exist and are at least this many bytes. Lookups are "
+    "cached at " + resources.NOTEBOOK_CACHE_PATH + ".",
+)
+@click.option(
+    "--firehose",
+    is_flag=True,
+    default=False,
+    help="Stream all of Reddit (/r/all) once and pick out the comments "
+    "from the subreddit set locally. Uses a single stream for any number "
+    "of subreddits.",
+)
+@click.option(
+    "--detach",
+    "-d",
+    is_flag=True,
+    default=False,
+    help="Run in the background. Use the status and stop commands to "
+    "check on or stop the running bot.",
+)
+def cli(
+    ctx, verbose, quiet, subreddit_set, env, min_size, firehose, detach
+):
     """
     Run the nbviewerbot on the selected subreddit set.
     """
@@ -272,7 +858,25 @@ def cli(ctx, verbose, quiet, subreddit_set, env):
         if env:
             dotenv.load_dotenv(env, override=True)
 
-        main(subs)
+        if detach:
+            click.echo("Starting nbviewerbot in the background")
+            try:
+                daemonize(resources.PIDFILE_PATH)
+            except RuntimeError as e:
+                raise click.ClickException(str(e))
+
+        try:
+            resolver = None
+            if min_size is not None:
+                resolver = NotebookResolver(min_size=min_size)
+
+            main(subs, resolver, SubredditStats(), firehose)
+        except Exception:
+            if detach:
+                # stderr is /dev/null once detached, so leave a trace in
+                # the log file
+                resources.LOGGER.exception("nbviewerbot failed")
+            raise
 
 
 @cli.command("subreddits")
@@ -293,5 +897,116 @@ def show_subreddits():
     click.echo(msg_all)
 
 
+@cli.command("stats")
+@click.option(
+    "--sort",
+    default="hits",
+    type=click.Choice(["name"] + list(COUNTERS)),
+    help="Column to sort by (descending, except for name)",
+)
+def show_stats(sort):
+    """Show per-subreddit stats and stream scheduling tiers"""
+    stats = SubredditStats()
+    rows = [(sub, stats.get(sub)) for sub in stats.subreddits()]
+    if not rows:
+        click.echo("No stats recorded yet")
+        return
+
+    if sort == "name":
+        rows.sort(key=lambda row: row[0])
+    else:
+        rows.sort(key=lambda row: row[1][sort], reverse=True)
+
+    fmt = "{:<24}" + "{:>10}" * (len(COUNTERS) + 1) + "  {}"
+    header = ["subreddit"] + list(COUNTERS) + ["yield", "tier"]
+    click.echo(fmt.format(*header))
+    for sub, counts in rows:
+        seen = counts["seen"]
+        hit_yield = "{:.2%}".format(counts["hits"] / seen) if seen else "-"
+        values = [sub] + [counts[c] for c in COUNTERS]
+        values += [hit_yield, stats.tier(sub)]
+        click.echo(fmt.format(*values))
+
+
+def _format_seconds(seconds):
+    """Format a number of seconds for display, or "-" if None"""
+    if seconds is None:
+        return "-"
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+@cli.command("status")
+@click.option(
+    "--json", "as_json", is_flag=True, help="Show the raw status as JSON"
+)
+def show_status(as_json):
+    """Show live stats of the running bot"""
+    try:
+        status = send_command(resources.CONTROL_SOCKET_PATH, "status")
+    except BotNotRunning:
+        raise click.ClickException("nbviewerbot is not running")
+
+    if as_json:
+        click.echo(json.dumps(status, indent=2, sort_keys=True))
+        return
+
+    last_reply = status["last_reply"]
+    if last_reply is not None:
+        last_reply = time.time() - last_reply
+    latency = status["reply_latency"]
+    backoff_state = status["backoff"]
+
+    click.echo("nbviewerbot is running (pid {})".format(status["pid"]))
+    click.echo("Queue depth: {}".format(status["queue_depth"]))
+    click.echo("Deferred replies: {}".format(status["deferred_replies"]))
+    click.echo("Last reply: {} ago".format(_format_seconds(last_reply)))
+    click.echo(
+        "Reply latency (last {} replies): p50 {}, p95 {}, max {}".format(
+            latency["replies"],
+            _format_seconds(latency["p50"]),
+            _format_seconds(latency["p95"]),
+            _format_seconds(latency["max"]),
+        )
+    )
+    if backoff_state["backing_off"]:
+        click.echo(
+            "Backing off: replying to {target}, try {tries}, "
+            "waiting {wait:.1f}s".format(**backoff_state)
+        )
+    else:
+        click.echo("Backing off: no")
+    click.echo(
+        "Thread cache: {threads} threads, {nodes} comments, "
+        "{hits} hits, {fetches} fetches".format(**status["thread_cache"])
+    )
+
+    click.echo("Streams:")
+    for name, stream in sorted(status["streams"].items()):
+        rate = stream["items_per_second"]
+        click.echo(
+            "  {:<16} {:>8} items/s  quiet for {:>8}  restarts {}  "
+            "worker {}".format(
+                name,
+                "{:.2f}".format(rate) if rate is not None else "-",
+                _format_seconds(stream["quiet_for"]),
+                stream["restarts"],
+                "alive" if status["workers"].get(name + "Worker") else "dead",
+            )
+        )
+    for name, alive in sorted(status["workers"].items()):
+        if name[: -len("Worker")] not in status["streams"]:
+            click.echo("  {:<16} {}".format(name, "alive" if alive else "dead"))
+
+
+@cli.command("stop")
+def stop():
+    """Stop the running bot"""
+    try:
+        response = send_command(resources.CONTROL_SOCKET_PATH, "stop")
+    except BotNotRunning:
+        raise click.ClickException("nbviewerbot is not running")
+    click.echo("Stopping nbviewerbot (pid {})".format(response["stopping"]))
+
+
 if __name__ == "__main__":
     cli()
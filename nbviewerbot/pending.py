@@ -0,0 +1,147 @@
+"""Save the work left over on shutdown, and pick it up again on start"""
+
+import hashlib
+import time
+
+from nbviewerbot import resources, utils
+
+
+class PendingWork:
+    """
+    The queued items that a run of the bot didn't get to, and how far each
+    of its streams got.
+
+    Items are kept as compact records of their fullname, stream and time
+    of ingestion, and fetched from Reddit again when the work is resumed.
+
+    Parameters
+    ----------
+    items : list[QueuedItem]
+        The items left to process
+    seen_until : dict[str, float]
+        Per stream name, the creation time (created_utc) of the newest item
+        read from the stream, whether it was handled or saved with the
+        pending items. Items in the backlog of a new stream that are older
+        have been taken care of already.
+    seen_last : dict[str, list[str]]
+        Per stream name, the fullnames of the items created at its
+        seen_until. Items created in the same second are only told apart
+        by these.
+    scopes : dict[str, str]
+        Per stream name, the stream_scope of the subreddits it reads. The
+        positions of a stream only apply to a stream of the same name and
+        scope.
+    """
+
+    def __init__(self, items=(), seen_until=None, seen_last=None, scopes=None):
+        self.items = list(items)
+        self.seen_until = dict(seen_until or {})
+        self.seen_last = {
+            stream: set(fullnames)
+            for stream, fullnames in (seen_last or {}).items()
+        }
+        self.scopes = dict(scopes or {})
+
+    def set_scopes(self, scopes):
+        """
+        Set the scopes of the streams of this run, dropping the positions
+        of streams whose subreddits changed since the previous run (e.g.
+        when switching to the firehose, or when a subreddit moves to
+        another tier). Their new streams may include items the old ones
+        never read.
+
+        Parameters
+        ----------
+        scopes : dict[str, str]
+            Per stream name, the stream_scope of its subreddits
+        """
+        for stream in list(self.seen_until):
+            if self.scopes.get(stream) != scopes.get(stream):
+                del self.seen_until[stream]
+                self.seen_last.pop(stream, None)
+        self.scopes = dict(scopes)
+
+    def mark_seen(self, item):
+        """Advance the seen_until of the stream of item (a QueuedItem)"""
+        if item.stream is None:
+            return
+        created = item.obj.created_utc
+        until = self.seen_until.get(item.stream, 0)
+        if created > until:
+            self.seen_until[item.stream] = created
+            self.seen_last[item.stream] = {item.obj.fullname}
+        elif created == until:
+            self.seen_last.setdefault(item.stream, set()).add(
+                item.obj.fullname
+            )
+
+    def save(self, path=resources.PENDING_PATH):
+        """Write the pending items and stream positions to path"""
+        utils.dump_json(
+            {
+                "saved": time.time(),
+                "items": [
+                    [i.obj.fullname, i.stream, i.ingested] for i in self.items
+                ],
+                "seen_until": self.seen_until,
+                "seen_last": {
+                    stream: sorted(fullnames)
+                    for stream, fullnames in self.seen_last.items()
+                },
+                "scopes": self.scopes,
+            },
+            path,
+        )
+        resources.LOGGER.info(
+            "Saved {} pending items to {}".format(len(self.items), path)
+        )
+
+    @classmethod
+    def load(cls, reddit, path=resources.PENDING_PATH):
+        """
+        Load the work saved by a previous run, and remove the file so that
+        it is only resumed once. The file is only removed once the items
+        have been fetched, so they aren't lost if Reddit is unavailable.
+
+        Parameters
+        ----------
+        reddit : praw.Reddit
+            Used to fetch the pending items by fullname, in batches
+        path : str
+
+        Returns
+        -------
+        PendingWork : empty if nothing was saved
+        """
+        data = utils.load_json(path, default=None)
+        if data is None:
+            utils.remove_file(path)  # unreadable, or nothing saved
+            return cls()
+
+        records = {fullname: (s, t) for fullname, s, t in data["items"]}
+        items = []
+        if records:
+            for obj in reddit.info(fullnames=list(records)):
+                stream, ingested = records[obj.fullname]
+                items.append(utils.QueuedItem(obj, stream, ingested))
+            items.sort(key=lambda item: item.ingested)
+        utils.remove_file(path)
+
+        resources.LOGGER.info(
+            "Resuming {} pending items saved {:.0f}s ago".format(
+                len(items), time.time() - data["saved"]
+            )
+        )
+        return cls(
+            items,
+            data["seen_until"],
+            data.get("seen_last"),
+            data.get("scopes"),
+        )
+
+
+def stream_scope(subreddits):
+    """Return a short, order independent identifier of a list of
+    subreddit names, for PendingWork.scopes"""
+    names = "+".join(sorted(name.lower() for name in subreddits))
+    return hashlib.sha1(names.encode()).hexdigest()[:12]
@@ -0,0 +1,303 @@
+"""Look up metadata (existence and size) of notebooks hosted on GitHub"""
+
+import os
+import time
+import threading
+from collections import namedtuple
+
+import requests
+import requests.adapters
+
+from nbviewerbot import resources, utils
+
+
+NotebookInfo = namedtuple("NotebookInfo", ["exists", "size"])
+
+# Hosts serving files from GitHub repositories (as opposed to gists)
+_REPO_HOSTS = {"github.com", "raw.githubusercontent.com"}
+
+
+class NotebookResolver:
+    """
+    Resolve GitHub notebook URLs to their existence and size using the
+    GitHub contents API.
+
+    Lookups go through a single pooled HTTP session and are cached on
+    disk. Fresh cache entries are served without any request. Stale
+    entries are revalidated with an If-None-Match request, which GitHub
+    answers with a cheap 304 (not counted against the rate limit) if
+    nothing changed. Missing notebooks (404) are cached as well, with
+    their own (usually shorter) TTL. When GitHub rate limits us (403 or
+    429), no requests are made until the limit resets, as given by the
+    Retry-After or X-RateLimit-Reset headers; cached entries are still
+    served in the meantime, stale or not.
+
+    Expired entries are pruned when the cache is loaded and saved: missing
+    notebooks as soon as they expire, found notebooks one TTL after they
+    expire (until then, their ETag is still worth revalidating). At most
+    max_entries are kept. Changes are written to disk at most every
+    flush_interval seconds, and whenever flush is called.
+
+    Parameters
+    ----------
+    cache_path : str or None
+        File to persist the cache to. If None, the cache is kept in
+        memory only.
+    api_url : str
+        Base URL of the GitHub API
+    ttl : float
+        Seconds before a found notebook's metadata must be revalidated
+    negative_ttl : float
+        Seconds before a missing notebook is looked up again
+    token : str, optional
+        GitHub token for authenticated (higher rate limit) requests.
+        Defaults to the GITHUB_TOKEN environment variable, if set.
+    timeout : float
+        Timeout for each request, in seconds
+    min_size : int
+        Notebooks smaller than this many bytes are dropped by filter_links
+    max_entries : int
+        Maximum number of notebooks to keep in the cache
+    flush_interval : float
+        Minimum number of seconds between automatic writes to disk
+    """
+
+    def __init__(
+        self,
+        cache_path=resources.NOTEBOOK_CACHE_PATH,
+        api_url=resources.GITHUB_API_URL,
+        ttl=resources.NOTEBOOK_CACHE_TTL,
+        negative_ttl=resources.NOTEBOOK_CACHE_NEGATIVE_TTL,
+        token=None,
+        timeout=5.0,
+        min_size=0,
+        max_entries=resources.NOTEBOOK_CACHE_MAX_ENTRIES,
+        flush_interval=resources.NOTEBOOK_CACHE_FLUSH_INTERVAL,
+    ):
+        self.cache_path = cache_path
+        self.api_url = api_url.rstrip("/")
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.min_size = min_size
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1)
+        self.session.mount(self.api_url, adapter)
+        self.session.headers["User-Agent"] = resources.USER_AGENT
+        self.session.headers["Accept"] = "application/vnd.github.v3+json"
+
+        token = token or os.environ.get("GITHUB_TOKEN")
+        if token:
+            self.session.headers["Authorization"] = "token {}".format(token)
+
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._dirty = False
+        self._last_flush = time.time()
+        self._rate_limited_until = 0
+        if cache_path is not None:
+            self._cache = utils.load_json(cache_path, default={})
+            self._prune(time.time())
+
+    def lookup(self, link):
+        """
+        Get the metadata of a notebook in a GitHub repository.
+
+        Parameters
+        ----------
+        link : str or utils.NotebookLink
+
+        Returns
+        -------
+        NotebookInfo or None : None if the link does not point to a file in
+        a GitHub repository or the metadata could not be retrieved
+        """
+        if not isinstance(link, utils.NotebookLink):
+            links = utils.classify_links([link])
+            if not links:
+                return None
+            link = links[0]
+
+        if link.host not in _REPO_HOSTS or link.filepath is None:
+            return None
+
+        key = "{}/{}/{}".format(link.repo, link.branch, link.filepath)
+        with self._lock:
+            return self._lookup(key, link.repo, link.branch, link.filepath)
+
+    def _lookup(self, key, repo, branch, filepath):
+        """Look up a notebook, using and updating the cache. Not thread
+        safe, call with self._lock held."""
+        now = time.time()
+        entry = self._cache.get(key)
+        if entry is not None and now < entry["expires"]:
+            return _entry_info(entry)
+
+        if now < self._rate_limited_until:
+            return _entry_info(entry) if entry is not None else None
+
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+
+        api_path = resources.GITHUB_CONTENTS_PATH_TEMPLATE.format(
+            repo, filepath
+        )
+        try:
+            response = self.session.get(
+                self.api_url + api_path,
+                params={"ref": branch},
+                headers=headers,
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            resources.LOGGER.warning(
+                "Could not look up notebook {}: {}".format(key, e)
+            )
+            return _entry_info(entry) if entry is not None else None
+
+        if response.status_code == 304:
+            entry["expires"] = now + self.ttl
+        elif response.status_code == 404:
+            entry = {
+                "exists": False,
+                "size": None,
+                "etag": None,
+                "expires": now + self.negative_ttl,
+            }
+        elif response.status_code == 200:
+            data = response.json()
+            size = data.get("size") if isinstance(data, dict) else None
+            entry = {
+                "exists": True,
+                "size": size,
+                "etag": response.headers.get("ETag"),
+                "expires": now + self.ttl,
+            }
+        else:
+            reset = _rate_limit_reset(response, now)
+            if reset is not None:
+                self._rate_limited_until = reset
+                resources.LOGGER.warning(
+                    "Rate limited by GitHub, not looking up notebooks for "
+                    "{:.0f}s".format(reset - now)
+                )
+            else:
+                resources.LOGGER.warning(
+                    "Unexpected status {} looking up notebook {}".format(
+                        response.status_code, key
+                    )
+                )
+            return _entry_info(entry) if entry is not None else None
+
+        self._cache[key] = entry
+        self._dirty = True
+        if len(self._cache) > self.max_entries:
+            self._prune(now)
+        if now - self._last_flush >= self.flush_interval:
+            self._flush()
+
+        return _entry_info(entry)
+
+    def _prune(self, now):
+        """Drop expired entries and, if there are more than
+        self.max_entries, the tenth of them expiring soonest (so that a full
+        cache isn't pruned on every lookup). Call with self._lock held."""
+        for key, entry in list(self._cache.items()):
+            keep_until = entry["expires"]
+            if entry["exists"]:
+                keep_until += self.ttl
+            if keep_until <= now:
+                del self._cache[key]
+                self._dirty = True
+
+        if len(self._cache) > self.max_entries:
+            excess = len(self._cache) - (
+                self.max_entries - self.max_entries // 10
+            )
+            by_expiry = sorted(
+                self._cache, key=lambda k: self._cache[k]["expires"]
+            )
+            for key in by_expiry[:excess]:
+                del self._cache[key]
+            self._dirty = True
+
+    def flush(self):
+        """Write the cache to disk, if it changed"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        """Prune the cache and write it to disk if it changed. Call with
+        self._lock held."""
+        now = time.time()
+        self._last_flush = now
+        self._prune(now)
+        if self._dirty and self.cache_path is not None:
+            utils.dump_json(self._cache, self.cache_path)
+        self._dirty = False
+
+    def filter_links(self, links):
+        """
+        Drop the links to notebooks that don't exist or are smaller than
+        self.min_size bytes. Links whose metadata can't be determined are
+        kept.
+
+        Parameters
+        ----------
+        links : list[str] or list[utils.NotebookLink]
+
+        Returns
+        -------
+        list : the links worth replying to
+        """
+        keep = []
+        for link in links:
+            info = self.lookup(link)
+            url = getattr(link, "url", link)
+            if info is None:
+                keep.append(link)
+            elif not info.exists:
+                resources.LOGGER.info("Skipping dead notebook {}".format(url))
+            elif info.size is not None and info.size < self.min_size:
+                resources.LOGGER.info(
+                    "Skipping small notebook {} ({} bytes)".format(
+                        url, info.size
+                    )
+                )
+            else:
+                keep.append(link)
+        return keep
+
+
+def _entry_info(entry):
+    """Convert a cache entry to a NotebookInfo"""
+    return NotebookInfo(entry["exists"], entry["size"])
+
+
+def _rate_limit_reset(response, now):
+    """Return the time until which a rate limited GitHub API response asks
+    us to stop making requests, or None if it isn't rate limited"""
+    headers = response.headers
+    # a 403 can also mean access to the repository is forbidden
+    limited = response.status_code == 429 or (
+        response.status_code == 403
+        and (
+            "Retry-After" in headers
+            or headers.get("X-RateLimit-Remaining") == "0"
+        )
+    )
+    if not limited:
+        return None
+
+    try:
+        return now + float(headers["Retry-After"])
+    except (KeyError, ValueError):
+        pass
+    try:
+        return max(now, float(headers["X-RateLimit-Reset"]))
+    except (KeyError, ValueError):
+        return now + resources.GITHUB_RATE_LIMIT_BACKOFF
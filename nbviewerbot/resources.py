@@ -17,6 +17,26 @@ PROJECT_DIR = os.path.realpath(os.path.join(SRC_DIR, ".."))
 LOGFILE_PATH = os.path.join(PROJECT_DIR, "nbviewerbot.log")
 LOGGER = logging.getLogger("nbviewerbot")
 
+# Background running (see control.py)
+PIDFILE_PATH = os.path.join(PROJECT_DIR, "nbviewerbot.pid")
+CONTROL_SOCKET_PATH = os.path.join(PROJECT_DIR, "nbviewerbot.sock")
+# Seconds an empty pidfile is taken to belong to a bot that is starting
+PIDFILE_START_TIMEOUT = 10
+
+# Persistent state
+NOTEBOOK_CACHE_PATH = os.path.join(PROJECT_DIR, "notebook_cache.json")
+SUBREDDIT_STATS_PATH = os.path.join(PROJECT_DIR, "subreddit_stats.json")
+SUBREDDIT_STATS_FLUSH_INTERVAL = 60
+# Maximum number of subreddits to keep stats for (e.g. when streaming /r/all)
+SUBREDDIT_STATS_MAX_SUBREDDITS = 5000
+PENDING_PATH = os.path.join(PROJECT_DIR, "pending.json")
+
+# Seconds to keep processing queued items on shutdown, before saving the
+# rest to PENDING_PATH (see pending.py)
+SHUTDOWN_DEADLINE = 20
+
+USER_AGENT = "python:nbviewerbot:v0.1.0 (by /u/jd_paton)"
+
 # Reddit auth info from PROJECT_DIR/.env
 DOTENV_PATH = os.path.join(SRC_DIR, ".env")
 
@@ -24,7 +44,7 @@ dotenv.load_dotenv(DOTENV_PATH)
 
 
 # Reddit authentication
-def get_reddit_auth_kwargs():
+def get_reddit_auth_kwargs(suffix=""):
     """Get the authentication kwargs for praw.Reddit from the environment.
 
     Requires the following environment variables to be set:
@@ -36,28 +56,56 @@ def get_reddit_auth_kwargs():
     See https://github.com/reddit-archive/reddit/wiki/OAuth2-Quick-Start-Example
     for more details.
 
+    Parameters
+    ----------
+    suffix : str, optional
+        Appended to the variable names, to read one of several credential
+        sets (e.g. "_2" for CLIENT_ID_2, CLIENT_SECRET_2, ...)
+
     """
     kwargs = dict()
-    kwargs["client_id"] = os.environ.get("CLIENT_ID")
-    kwargs["client_secret"] = os.environ.get("CLIENT_SECRET")
-    kwargs["username"] = os.environ.get("USERNAME")
-    kwargs["password"] = os.environ.get("PASSWORD")
-    kwargs["user_agent"] = "python:nbviewerbot:v0.1.0 (by /u/jd_paton)"
-
-    for key, value in kwargs.items():
-        if value is None:
+    for key in ["client_id", "client_secret", "username", "password"]:
+        var = key.upper() + suffix
+        kwargs[key] = os.environ.get(var)
+        if kwargs[key] is None:
             raise KeyError(
                 "{} not found in environment variables. "
-                "Have you filled in your .env file?".format(key.upper())
+                "Have you filled in your .env file?".format(var)
             )
+    kwargs["user_agent"] = USER_AGENT
+
     return kwargs
 
 
-def load_reddit():
+def get_reddit_auth_kwargs_pool():
+    """Get the authentication kwargs for all configured Reddit accounts.
+
+    The first account is configured as described in get_reddit_auth_kwargs.
+    Additional accounts use the same variables with the suffixes _2, _3,
+    etc. (e.g. CLIENT_ID_2, CLIENT_SECRET_2, USERNAME_2, PASSWORD_2). The
+    search stops at the first suffix for which USERNAME is not set.
+
+    Returns
+    -------
+    list[dict] : the kwargs for each account
+    """
+    pool = [get_reddit_auth_kwargs()]
+    n = 2
+    while os.environ.get("USERNAME_{}".format(n)) is not None:
+        pool.append(get_reddit_auth_kwargs("_{}".format(n)))
+        n += 1
+    return pool
+
+
+def load_reddit(kwargs=None):
     """
     Get the authentication kwargs from the environment and authenticate with
     Reddit.
 
+    Parameters
+    ----------
+    kwargs : dict, optional
+        Authentication kwargs to use instead of those from the environment
 
     Returns
     -------
@@ -65,7 +113,8 @@ def load_reddit():
 
     See also: utils.get_reddit_auth_kwargs
     """
-    kwargs = get_reddit_auth_kwargs()
+    if kwargs is None:
+        kwargs = get_reddit_auth_kwargs()
     reddit = praw.Reddit(**kwargs)
     LOGGER.info(
         "Successfully authenticated with Reddit as {}".format(
@@ -75,14 +124,51 @@ def load_reddit():
     return reddit
 
 
+def load_reddits():
+    """
+    Authenticate with Reddit with each account configured in the
+    environment.
+
+    Returns
+    -------
+    list[praw.Reddit] : the authenticated Reddit clients
+
+    See also: resources.get_reddit_auth_kwargs_pool
+    """
+    return [load_reddit(kwargs) for kwargs in get_reddit_auth_kwargs_pool()]
+
+
+# GitHub API (for looking up notebook metadata)
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_CONTENTS_PATH_TEMPLATE = "/repos/{}/contents/{}"
+# Seconds to stop looking up notebooks after being rate limited, when the
+# response doesn't say until when
+GITHUB_RATE_LIMIT_BACKOFF = 60
+
+# How long (in seconds) looked up notebook metadata is considered fresh.
+# Stale entries are revalidated with a conditional request.
+NOTEBOOK_CACHE_TTL = 6 * 60 * 60
+NOTEBOOK_CACHE_NEGATIVE_TTL = 60 * 60
+# Stale entries are kept for revalidation for up to another TTL, and the
+# cache holds at most this many entries (those expiring soonest go first)
+NOTEBOOK_CACHE_MAX_ENTRIES = 10000
+NOTEBOOK_CACHE_FLUSH_INTERVAL = 60
+
+# Reply rate limiting per Reddit account, when replying from several
+# accounts: a token bucket holding up to REPLY_BURST replies, refilled at
+# REPLY_RATE replies per second (see accounts.ReplyPool)
+REPLY_RATE = 1 / 10
+REPLY_BURST = 5
+
+
 # Templates (for use with string.format)
 # TODO: Convert these all to string.Template
 NBVIEWER_URL_TEMPLATE = "https://nbviewer.jupyter.org/url/{}"
 
-BINDER_URL_TEMPLATE_NO_FILEPATH = "https://mybinder.org/v2/gh/{}/{}"
+BINDER_URL_TEMPLATE_NO_FILEPATH = "https://mybinder.org/v2/{}/{}/{}"
 
 BINDER_URL_TEMPLATE_WITH_FILEPATH = (
-    "https://mybinder.org/v2/gh/{}/{}?filepath={}"
+    "https://mybinder.org/v2/{}/{}/{}?filepath={}"
 )
 
 
@@ -131,10 +217,24 @@ links to start your own Jupyter server!
     + _comment_footer
 )
 
+# Limits for parsing the HTML of comments and submissions (see
+# utils.get_all_links): characters, links, and seconds per body
+PARSE_MAX_SIZE = 256 * 1024
+PARSE_MAX_LINKS = 100
+PARSE_TIME_BUDGET = 0.5
+
 # Regexes
 _url_rx = "^http.*"
 URL_RX = re.compile(_url_rx)
 
+_a_tag_rx = r"<a\s[^<>]*>"
+A_TAG_RX = re.compile(_a_tag_rx, re.IGNORECASE)
+
+# Splits a link into its host (without "www.") and path, for looking up the
+# host in the hosts registry (see utils.classify_links)
+_href_rx = r"^https?://(?:www\.)?([^/?#:]+)(?::\d+)?(/[^?#]*)?"
+HREF_RX = re.compile(_href_rx, re.IGNORECASE)
+
 # Subreddit lists
 SUBREDDITS_TEST = [
     "testingground4bots",
@@ -152,3 +252,32 @@ with open(SUBREDDITS_RELEVANT_PATH, "r") as h:
     SUBREDDITS_RELEVANT += SUBREDDITS_TEST
 
 SUBREDDITS_ALL = ["all"]
+
+# Stream scheduling based on subreddit stats (see stats.SubredditStats.tier)
+SCHEDULE_MIN_SEEN = 500
+SCHEDULE_SLOW_YIELD = 0.001
+SCHEDULE_HOT_YIELD = 0.01
+# Seconds to wait between polls of the low-yield subreddits' streams
+SLOW_STREAM_INTERVAL = 5 * 60
+# Items per stream listing. A throttled stream waits less between polls
+# when more than half a page of items arrives per wait.
+STREAM_PAGE_SIZE = 100
+
+# Stream watchdog (see monitor.StreamMonitor). A stream is recreated when it
+# has been quiet for STREAM_STALL_FACTOR times its usual time between items,
+# and at least STREAM_STALL_MIN_QUIET seconds (longer than
+# SLOW_STREAM_INTERVAL, so that throttled streams don't count as stalled).
+STREAM_STALL_FACTOR = 20
+STREAM_STALL_MIN_QUIET = 15 * 60
+WATCHDOG_INTERVAL = 30
+
+# Cache of comment trees for already_replied (see threadcache.ThreadCache)
+THREAD_CACHE_TTL = 60  # seconds
+THREAD_CACHE_MAX_NODES = 20000  # comments
+# Allowed difference between Reddit's clock (created_utc) and ours
+THREAD_CACHE_CLOCK_SKEW = 10  # seconds
+
+# Reply latency tracking (see monitor.LatencyTracker), in seconds
+REPLY_LATENCY_SLO = 5 * 60
+LATENCY_WINDOW = 1000
+LATENCY_REPORT_EVERY = 10  # replies
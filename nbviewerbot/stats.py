@@ -0,0 +1,212 @@
+"""Per-subreddit statistics, used to decide which subreddits to handle and
+how often to poll them"""
+
+import time
+import threading
+
+from nbviewerbot import resources, utils
+
+
+COUNTERS = ("seen", "hits", "replies", "forbidden")
+
+# Scheduling tiers
+HOT = "hot"
+FAST = "fast"
+SLOW = "slow"
+DROPPED = "dropped"
+
+
+class SubredditStats:
+    """
+    Persistent per-subreddit counters:
+
+    * seen : comments and submissions processed
+    * hits : items containing links to notebooks
+    * replies : replies posted
+    * forbidden : replies refused by Reddit (we are probably banned)
+
+    Counters are kept in memory and written to disk at most every
+    flush_interval seconds, and whenever flush is called. Once there are
+    counters for max_subreddits subreddits, new subreddits are only
+    recorded if they refuse our replies.
+
+    Parameters
+    ----------
+    path : str or None
+        JSON file to persist the counters to. If None, the counters are
+        kept in memory only.
+    flush_interval : float
+        Minimum number of seconds between automatic writes to disk
+    max_subreddits : int
+        Maximum number of subreddits to keep counters for
+    """
+
+    def __init__(
+        self,
+        path=resources.SUBREDDIT_STATS_PATH,
+        flush_interval=resources.SUBREDDIT_STATS_FLUSH_INTERVAL,
+        max_subreddits=resources.SUBREDDIT_STATS_MAX_SUBREDDITS,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_subreddits = max_subreddits
+
+        self._lock = threading.Lock()
+        self._counts = {}
+        if path is not None:
+            self._counts = utils.load_json(path, default={})
+        self._last_flush = time.time()
+
+    def record(self, subreddit, counter, n=1):
+        """
+        Increment a counter for a subreddit.
+
+        Parameters
+        ----------
+        subreddit : str
+        counter : str
+            One of stats.COUNTERS
+        n : int
+            The amount to increment by
+        """
+        if counter not in COUNTERS:
+            raise ValueError("Unknown counter {}".format(counter))
+
+        subreddit = subreddit.lower()
+        with self._lock:
+            if (
+                subreddit not in self._counts
+                and len(self._counts) >= self.max_subreddits
+                and counter != "forbidden"
+            ):
+                return  # full, only bans are worth remembering now
+
+            counts = self._counts.setdefault(
+                subreddit, dict.fromkeys(COUNTERS, 0)
+            )
+            counts[counter] += n
+
+            if time.time() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def get(self, subreddit):
+        """Return a dict with the counters of a subreddit"""
+        with self._lock:
+            counts = self._counts.get(subreddit.lower(), {})
+            return {c: counts.get(c, 0) for c in COUNTERS}
+
+    def subreddits(self):
+        """Return the names of all subreddits with recorded stats"""
+        with self._lock:
+            return list(self._counts)
+
+    def banned(self):
+        """Return the set of subreddits that have refused our replies"""
+        with self._lock:
+            return {s for s, c in self._counts.items() if c["forbidden"] > 0}
+
+    def tier(
+        self,
+        subreddit,
+        min_seen=resources.SCHEDULE_MIN_SEEN,
+        slow_yield=resources.SCHEDULE_SLOW_YIELD,
+        hot_yield=resources.SCHEDULE_HOT_YIELD,
+    ):
+        """
+        Decide how a subreddit should be polled.
+
+        Parameters
+        ----------
+        subreddit : str
+        min_seen : int
+            Subreddits with fewer items seen than this don't have enough
+            data to be judged, and are polled fast
+        slow_yield : float
+            Subreddits with a smaller fraction of items containing
+            notebook links than this are polled slowly
+        hot_yield : float
+            Subreddits with at least this fraction of items containing
+            notebook links get dedicated streams
+
+        Returns
+        -------
+        str : stats.HOT, stats.FAST, stats.SLOW or stats.DROPPED
+        """
+        counts = self.get(subreddit)
+        if counts["forbidden"] > 0:
+            return DROPPED
+        if counts["seen"] < min_seen:
+            return FAST
+        hit_yield = counts["hits"] / counts["seen"]
+        if hit_yield < slow_yield:
+            return SLOW
+        if hit_yield >= hot_yield:
+            return HOT
+        return FAST
+
+    def schedule(self, subreddits, **kwargs):
+        """
+        Split subreddits into scheduling tiers.
+
+        Parameters
+        ----------
+        subreddits : list[str]
+        kwargs
+            Passed on to SubredditStats.tier
+
+        Returns
+        -------
+        dict[str, list[str]] : the subreddits of each tier
+        """
+        tiers = {HOT: [], FAST: [], SLOW: [], DROPPED: []}
+        for sub in subreddits:
+            tiers[self.tier(sub, **kwargs)].append(sub)
+        return tiers
+
+    def flush(self):
+        """Write the counters to disk"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        """Write the counters to disk. Call with self._lock held."""
+        self._last_flush = time.time()
+        if self.path is not None:
+            utils.dump_json(self._counts, self.path)
+
+
+class SubredditFilter:
+    """
+    Decide which subreddits to handle items from, in constant time per item.
+
+    Both sets are frozensets of lowercase names. block replaces the blocked
+    set rather than mutating it, so it can be called while other threads
+    are filtering.
+
+    Parameters
+    ----------
+    allowed : iterable of str or None
+        The subreddits to accept items from. If None, accept all
+        subreddits that aren't blocked.
+    blocked : iterable of str
+        The subreddits to never accept items from
+    """
+
+    def __init__(self, allowed=None, blocked=()):
+        self.allowed = None
+        if allowed is not None:
+            self.allowed = frozenset(sub.lower() for sub in allowed)
+        self.blocked = frozenset(sub.lower() for sub in blocked)
+
+    def accepts(self, subreddit):
+        """Whether to accept items from subreddit (a lowercase name)"""
+        if subreddit in self.blocked:
+            return False
+        return self.allowed is None or subreddit in self.allowed
+
+    def block(self, subreddit):
+        """Stop accepting items from subreddit"""
+        subreddit = subreddit.lower()
+        if subreddit not in self.blocked:
+            resources.LOGGER.warning("Blocking subreddit {}".format(subreddit))
+            self.blocked = self.blocked | {subreddit}
@@ -1,15 +1,25 @@
 import urllib
 
-from nbviewerbot import utils, resources
+from nbviewerbot import utils, resources, hosts
+
+
+def notebook_link(url):
+    """Return the utils.NotebookLink for url if it is not already one."""
+    if isinstance(url, utils.NotebookLink):
+        return url
+
+    links = utils.classify_links([url])
+    if not links:
+        raise ValueError("Not a Jupyter Notebook url: {}".format(url))
+    return links[0]
 
 
 def nbviewer_url(url):
-    """Return the nbviewer url for the given url."""
-    link = utils.get_notebook_path(url)
-    return resources.NBVIEWER_URL_TEMPLATE.format(link)
+    """Return the nbviewer url for the given url or utils.NotebookLink."""
+    return resources.NBVIEWER_URL_TEMPLATE.format(notebook_link(url).path)
 
 
-def binder_url(repo, branch="master", filepath=None):
+def binder_url(repo, branch="master", filepath=None, provider="gh"):
     """
     Build a binder url. If filepath is provided, the url will be for
     the specific file.
@@ -17,11 +27,15 @@ def binder_url(repo, branch="master", filepath=None):
     Parameters
     ----------
     repo: str
-        The repository in the form "username/reponame"
+        The repository in the form "username/reponame" (or
+        "username/gistid" for gists)
     branch: str, optional
         The branch, default "master"
     filepath: str, optional
         The path to a file in the repo, e.g. dir1/dir2/notebook.ipynb
+    provider: str, optional
+        The binder repository provider, default "gh" (GitHub). See
+        hosts.NotebookHost.binder_spec
 
     Returns
     -------
@@ -32,17 +46,26 @@ def binder_url(repo, branch="master", filepath=None):
     if filepath is not None:
         fpath = urllib.parse.quote(filepath, safe="%")
         return resources.BINDER_URL_TEMPLATE_WITH_FILEPATH.format(
-            repo, branch, fpath
+            provider, repo, branch, fpath
         )
 
     else:
-        return resources.BINDER_URL_TEMPLATE_NO_FILEPATH.format(repo, branch)
+        return resources.BINDER_URL_TEMPLATE_NO_FILEPATH.format(
+            provider, repo, branch
+        )
+
+
+def binder_url_for_link(url):
+    """Return the binder url for the given url or utils.NotebookLink."""
+    link = notebook_link(url)
+    provider, repo = hosts.get_host(link.host).binder_spec(link.repo)
+    return binder_url(repo, link.branch, link.filepath, provider)
 
 
 def comment_single_link(url):
     """Construct the single link bot reply comment for the given url"""
     nbv_link = nbviewer_url(url)
-    binder_link = binder_url(*utils.get_github_info(url))
+    binder_link = binder_url_for_link(url)
     return resources.COMMENT_TEMPLATE_SINGLE.format(nbv_link, binder_link)
 
 
@@ -51,7 +74,7 @@ def comment_multi_link(urls):
     nbv_links = [nbviewer_url(url) for url in urls]
     nbv_links_string = "\n\n".join(nbv_links)
 
-    binder_links = [binder_url(*utils.get_github_info(url)) for url in urls]
+    binder_links = [binder_url_for_link(url) for url in urls]
     binder_links_string = "\n\n".join(binder_links)
 
     return resources.COMMENT_TEMPLATE_MULTI.format(
@@ -72,14 +95,14 @@ def comment(urls):
 
     Parameters
     ----------
-    urls : string or list of strings
+    urls : string, utils.NotebookLink or list of these
         The url(s) to use in the comment
 
     Returns
     -------
     string : the constructed comment
     """
-    if type(urls) is str:
+    if type(urls) is str or isinstance(urls, utils.NotebookLink):
         return comment_single_link(urls)
 
     elif len(urls) == 1:
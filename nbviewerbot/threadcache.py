@@ -0,0 +1,215 @@
+"""Share fetched comment trees between the comments of a thread"""
+
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+import praw.exceptions
+import praw.models
+import prawcore.exceptions
+
+from nbviewerbot import resources
+
+
+# The reply authors of every comment in a thread, as fetched at a time:
+# repliers is a dict of {fullname: {lowercase author names}}
+_Thread = namedtuple("_Thread", ["fetched", "repliers"])
+
+
+class ThreadCache:
+    """
+    Short lived cache of the comment trees of threads, keyed by the
+    fullname of their submission (a comment's link_id). Checking whether
+    we have replied to several comments in a busy thread takes a single
+    fetch of the tree, rather than a refresh of every comment.
+
+    Our own replies are remembered for ttl seconds after they are posted,
+    on top of the cached trees (which may not include them yet), so the
+    cache stays accurate for replies from this process. Comments
+    created after a tree was fetched (by more than clock_skew seconds)
+    have no replies other than ours yet, as far as the cache is
+    concerned. Comments that were created earlier but are missing from
+    the tree, or whose replies are partly hidden behind "load more
+    comments" or "continue this thread", are unknown.
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds to keep a fetched tree
+    max_nodes : int
+        Maximum number of comments (plus one per thread) to keep across all
+        trees. The least recently fetched trees are dropped first.
+    clock_skew : float
+        Seconds by which Reddit's clock (created_utc) may be ahead of ours
+    """
+
+    def __init__(
+        self,
+        ttl=resources.THREAD_CACHE_TTL,
+        max_nodes=resources.THREAD_CACHE_MAX_NODES,
+        clock_skew=resources.THREAD_CACHE_CLOCK_SKEW,
+    ):
+        self.ttl = ttl
+        self.max_nodes = max_nodes
+        self.clock_skew = clock_skew
+        self.nodes = 0
+        self.hits = 0
+        self.fetches = 0
+
+        self._threads = OrderedDict()  # by fetch time, oldest first
+        self._own = OrderedDict()  # {fullname: (time, {usernames})}
+        self._lock = threading.Lock()
+
+    def repliers(self, praw_obj):
+        """
+        Return the lowercase names of the authors of the direct replies to a
+        comment or submission, fetching its thread if it isn't cached.
+
+        Parameters
+        ----------
+        praw_obj : Comment or Submission
+
+        Returns
+        -------
+        set[str] or None : None if the object isn't in the cached tree of
+        its thread, and may have replies the cache doesn't know about
+        """
+        key = _thread_key(praw_obj)
+        now = time.time()
+
+        with self._lock:
+            self._expire(now)
+            thread = self._threads.get(key)
+            if thread is not None:
+                self.hits += 1
+
+        if thread is None:
+            thread = self._fetch(praw_obj, key, now)
+            if thread is None:
+                return None
+
+        with self._lock:
+            own = self._own.get(praw_obj.fullname, (None, set()))[1]
+            if praw_obj.fullname in thread.repliers:
+                return thread.repliers[praw_obj.fullname] | own
+            if praw_obj.created_utc > thread.fetched + self.clock_skew:
+                return set(own)
+        return None
+
+    def add_reply(self, praw_obj, username):
+        """
+        Record a reply we posted to a comment or submission.
+
+        Parameters
+        ----------
+        praw_obj : Comment or Submission
+        username : str or collection of str
+            The username(s) the reply was posted as
+        """
+        if type(username) is str:
+            username = [username]
+
+        with self._lock:
+            _, names = self._own.pop(praw_obj.fullname, (None, set()))
+            names.update(name.lower() for name in username)
+            self._own[praw_obj.fullname] = (time.time(), names)
+
+    def _fetch(self, praw_obj, key, now):
+        """Fetch and cache the tree of a thread, returning its _Thread, or
+        None if it can't be fetched"""
+        submission = praw_obj
+        if isinstance(praw_obj, praw.models.Comment):
+            submission = praw_obj.submission
+
+        # newest first, so that the freshly streamed comments we check are
+        # in the loaded page rather than behind "load more comments"
+        submission.comment_sort = "new"
+
+        repliers = {submission.fullname: set()}
+        incomplete = set()  # with replies that weren't loaded
+        try:
+            comments = list(submission.comments)
+            if _has_more(comments):
+                incomplete.add(submission.fullname)
+            for comment, replies in _walk(comments):
+                repliers.setdefault(comment.fullname, set())
+                if _has_more(replies):
+                    incomplete.add(comment.fullname)
+                if comment.author is not None:
+                    repliers.setdefault(comment.parent_id, set()).add(
+                        comment.author.name.lower()
+                    )
+        except (
+            praw.exceptions.PRAWException,
+            prawcore.exceptions.PrawcoreException,
+        ):
+            resources.LOGGER.exception(
+                "Could not fetch comments of thread {}".format(key)
+            )
+            return None
+
+        for fullname in incomplete:
+            repliers.pop(fullname, None)
+        thread = _Thread(now, repliers)
+        with self._lock:
+            self.fetches += 1
+            old = self._threads.pop(key, None)
+            if old is not None:
+                self.nodes -= len(old.repliers)
+            self._threads[key] = thread
+            self.nodes += len(repliers)
+            while self.nodes > self.max_nodes and len(self._threads) > 1:
+                _, dropped = self._threads.popitem(last=False)
+                self.nodes -= len(dropped.repliers)
+        return thread
+
+    def _expire(self, now):
+        """Drop the trees and own replies older than the TTL. Call with
+        self._lock held."""
+        while self._threads:
+            key, thread = next(iter(self._threads.items()))
+            if now - thread.fetched < self.ttl:
+                break
+            del self._threads[key]
+            self.nodes -= len(thread.repliers)
+
+        while self._own:
+            fullname, (posted, _) = next(iter(self._own.items()))
+            if now - posted < self.ttl:
+                break
+            del self._own[fullname]
+
+    def summary(self):
+        """Return the size and hit counts of the cache, for status reports"""
+        with self._lock:
+            return {
+                "threads": len(self._threads),
+                "nodes": self.nodes,
+                "hits": self.hits,
+                "fetches": self.fetches,
+            }
+
+
+def _thread_key(praw_obj):
+    """The fullname of the submission a comment or submission belongs to"""
+    if isinstance(praw_obj, praw.models.Comment):
+        return praw_obj.link_id
+    return praw_obj.fullname
+
+
+def _walk(comments):
+    """Yield all comments in a comment forest along with the list of their
+    replies, skipping "load more comments" placeholders"""
+    stack = list(comments)
+    while stack:
+        comment = stack.pop()
+        if isinstance(comment, praw.models.Comment):
+            replies = list(comment.replies)
+            yield comment, replies
+            stack.extend(replies)
+
+
+def _has_more(comments):
+    """Whether a list of comments includes a "load more comments" or
+    "continue this thread" placeholder"""
+    return any(isinstance(c, praw.models.MoreComments) for c in comments)
@@ -1,11 +1,34 @@
+import os
+import json
 import urllib
 import logging
 import pickle
+import tempfile
+import threading
+import time
+from collections import namedtuple, Counter
+from html.parser import HTMLParser
 from queue import Full
 
-from bs4 import BeautifulSoup
+from nbviewerbot import resources, hosts
 
-from nbviewerbot import resources
+# An item from a stream, tagged with its stream and time of ingestion
+QueuedItem = namedtuple("QueuedItem", ["obj", "stream", "ingested"])
+
+# Put on a queue by a worker thread when it exits, see notify_exit
+WorkerExit = namedtuple("WorkerExit", ["name"])
+
+# Put on a queue to wake up its consumer, e.g. to have it check a stop event
+WAKE_UP = "WAKE_UP"
+
+# Number of times HTML parsing was cut short, by limit ("size", "links" or
+# "time"). See get_all_links.
+PARSE_LIMITS_HIT = Counter()
+
+# A link to a notebook, decomposed by classify_links
+NotebookLink = namedtuple(
+    "NotebookLink", ["url", "host", "repo", "branch", "filepath", "path"]
+)
 
 
 def parse_url_if_not_parsed(url):
@@ -99,27 +122,180 @@ def get_github_info(url):
     return repo, branch, filepath
 
 
-def get_all_links(html):
+class _LinkParser(HTMLParser):
+    """Collects the http(s) hrefs of <a> tags, up to max_links of them"""
+
+    def __init__(self, max_links):
+        super().__init__(convert_charrefs=True)
+        self.max_links = max_links
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a" or len(self.links) >= self.max_links:
+            return
+        for name, value in attrs:
+            if name == "href" and value and resources.URL_RX.match(value):
+                self.links.append(value)
+                break
+
+
+def get_all_links(
+    html,
+    max_size=resources.PARSE_MAX_SIZE,
+    max_links=resources.PARSE_MAX_LINKS,
+    time_budget=resources.PARSE_TIME_BUDGET,
+    source=None,
+):
     """
     Parse HTML and extract all http(s) hyperlink destinations
 
+    The HTML is scanned incrementally for <a> tags, and scanning stops
+    early once max_size characters have been read, max_links links have
+    been found, or time_budget seconds have passed. This keeps huge bodies
+    (pasted logs, tables) from holding up the processing of other items.
+    Early stops are counted in PARSE_LIMITS_HIT and logged.
+
     Parameters
     ----------
     html : str
+    max_size : int
+        Maximum number of characters to scan
+    max_links : int
+        Maximum number of links to return
+    time_budget : float
+        Maximum number of seconds to spend scanning
+    source : str, optional
+        Description of where the HTML comes from, for logging
 
     Returns
     -------
     list[str] : the found URLs (if any)
 
     """
-    soup = BeautifulSoup(html, features="html.parser")
-    links = soup.find_all("a", attrs={"href": resources.URL_RX})
-    return [link.get("href") for link in links]
+    parser = _LinkParser(max_links)
+    deadline = time.monotonic() + time_budget
+
+    limit = None
+    # only the <a> tags are parsed, the rest is skipped by the regex engine
+    for tag in resources.A_TAG_RX.finditer(html, 0, max_size):
+        parser.feed(tag.group())
+        # drop what's left of a tag the regex cut short (e.g. at a ">" in
+        # a quoted attribute), so it doesn't swallow the following tags
+        parser.reset()
+        if len(parser.links) >= max_links:
+            limit = "links"
+        elif time.monotonic() > deadline:
+            limit = "time"
+        if limit is not None:
+            break
+    else:
+        if len(html) > max_size:
+            limit = "size"
+
+    if limit is not None:
+        PARSE_LIMITS_HIT[limit] += 1
+        resources.LOGGER.warning(
+            "Stopped parsing {} of {} characters early, {} limit "
+            "reached".format(source or "HTML", len(html), limit)
+        )
+
+    return parser.links
+
+
+def classify_links(hrefs):
+    """
+    Pick out the links to Jupyter Notebooks on known hosts (see
+    hosts.HOSTS) from a list of URLs and decompose them. Each URL costs a
+    single precompiled match and a host lookup, plus a match against the
+    host's own pattern if the host is known.
+
+    Parameters
+    ----------
+    hrefs : iterable of str
+
+    Returns
+    -------
+    list[NotebookLink] : the notebook links, deduplicated and in order
+
+    Examples
+    --------
+    >>> nbviewerbot.utils.classify_links([
+    ...     'https://example.com',
+    ...     'https://raw.githubusercontent.com/JohnPaton/numpy-neural-networks/'
+    ...     'master/01-single-layer-perceptron.ipynb',
+    ... ])
+    [NotebookLink(url='https://raw.githubusercontent.com/JohnPaton/numpy-neural-networks/master/01-single-layer-perceptron.ipynb', host='raw.githubusercontent.com', repo='JohnPaton/numpy-neural-networks', branch='master', filepath='01-single-layer-perceptron.ipynb', path='raw.githubusercontent.com/JohnPaton/numpy-neural-networks/master/01-single-layer-perceptron.ipynb')]
+
+    """
+    match = resources.HREF_RX.match
+    get_host = hosts.get_host
+    seen = set()
+    links = []
+    for href in hrefs:
+        if href in seen:
+            continue
+        seen.add(href)
+
+        m = match(href)
+        if m is None:
+            continue
+
+        netloc, path = m.groups()
+        netloc = netloc.lower()
+        host = get_host(netloc)
+        if host is None or path is None:
+            continue
+
+        m = host.matcher.match(path)
+        if m is None:
+            continue
+
+        groups = m.groupdict()
+        links.append(
+            NotebookLink(
+                url=href,
+                host=netloc,
+                repo=groups["repo"],
+                branch=groups.get("branch") or "master",
+                filepath=groups.get("filepath"),
+                path=host.nbviewer_path(netloc, path, groups),
+            )
+        )
+
+    return links
+
+
+def get_notebook_links(html, source=None):
+    """
+    Parse HTML and extract and classify all links to Jupyter Notebooks
+    on known hosts (see hosts.HOSTS).
+
+    Parameters
+    ----------
+    html : str or list[str]
+        One HTML body, or several to handle in a single pass
+    source : str, optional
+        Description of where the HTML comes from, for logging
+
+    Returns
+    -------
+    list[NotebookLink] : the found notebook links (if any)
+
+    See also: utils.classify_links
+    """
+    if type(html) is str:
+        html = [html]
+
+    hrefs = [
+        href for body in html for href in get_all_links(body, source=source)
+    ]
+    return classify_links(hrefs)
 
 
 def get_github_jupyter_links(html):
     """
-    Parse HTML and exract all links to Jupyter Notebooks hosted on GitHub
+    Parse HTML and exract all links to Jupyter Notebooks on known hosts
+    (GitHub, GitLab, Bitbucket, see hosts.HOSTS)
 
     Parameters
     ----------
@@ -129,40 +305,36 @@ def get_github_jupyter_links(html):
     -------
     list[str] : the found URLs (if any)
 
-    See also: utils.is_github_jupyter_url
+    See also: utils.get_notebook_links
     """
-    links = get_all_links(html)
-    return [link for link in links if is_github_jupyter_url(link)]
+    return [link.url for link in get_notebook_links(html)]
 
 
 def get_comment_jupyter_links(comment):
-    """Extract jupyter lins from a comment, if any"""
-    html = comment.body_html
-    jupy_links = get_github_jupyter_links(html)
-    return jupy_links
+    """Extract jupyter links from a comment, if any"""
+    source = "comment {}".format(comment.id)
+    return get_notebook_links(comment.body_html, source=source)
 
 
 def get_submission_jupyter_links(submission):
     """Extract jupyer links from a submission, if any"""
-    jupy_links = []
+    hrefs = []
     if submission.selftext_html is not None:
         # self post, read html
-        html = submission.selftext_html
-        jupy_links += get_github_jupyter_links(html)
-
-    if is_github_jupyter_url(submission.url):
-        jupy_links += [submission.url]
+        source = "submission {}".format(submission.id)
+        hrefs += get_all_links(submission.selftext_html, source=source)
 
-    # dedupe
-    jupy_links = list(dict.fromkeys(jupy_links))
+    hrefs.append(submission.url)
 
-    return jupy_links
+    return classify_links(hrefs)
 
 
 def setup_logger(console_level=logging.INFO, file_level=logging.DEBUG):
     """
     Set up the nbviewerbot with a level for console logging and a level for
     file logging. If either level is None, do not log to that destination.
+    Handlers from previous calls are removed, so calling this repeatedly
+    does not duplicate log output.
 
     Parameters
     ----------
@@ -179,6 +351,10 @@ def setup_logger(console_level=logging.INFO, file_level=logging.DEBUG):
     logger = logging.getLogger("nbviewerbot")
     logger.setLevel(logging.DEBUG)
 
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
     fmt = logging.Formatter(
         "%(asctime)s %(levelname)s(%(threadName)s) - %(message)s"
     )
@@ -198,37 +374,215 @@ def setup_logger(console_level=logging.INFO, file_level=logging.DEBUG):
     return logger
 
 
+def load_json(path, default=None):
+    """
+    Load a JSON file, returning default if it does not exist or cannot be
+    decoded.
+
+    Parameters
+    ----------
+    path : str
+    default : object, optional
+
+    Returns
+    -------
+    object : the decoded contents, or default
+    """
+    try:
+        with open(path, "r") as h:
+            return json.load(h)
+    except FileNotFoundError:
+        return default
+    except ValueError:
+        resources.LOGGER.warning(
+            "Could not decode {}, ignoring its contents".format(path)
+        )
+        return default
+
+
+def dump_json(obj, path):
+    """
+    Atomically write obj to path as JSON. The data is written to a
+    temporary file in the same directory which then replaces path, so
+    readers never see a partially written file.
+
+    Parameters
+    ----------
+    obj : object
+        Any JSON-serializable object
+    path : str
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as h:
+            json.dump(obj, h)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def remove_file(path):
+    """Remove a file if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
 def praw_object_type(praw_obj):
     """Return the type of the praw object (comment/submission) as a
     lowercase string."""
     return type(praw_obj).__name__.lower()
 
 
+def praw_object_subreddit(praw_obj):
+    """Return the lowercase name of the subreddit of a praw object."""
+    return str(praw_obj.subreddit).lower()
+
+
+def praw_object_thread_id(praw_obj):
+    """Return the id of the submission a praw object (comment/submission)
+    belongs to."""
+    if praw_object_type(praw_obj) == "comment":
+        return praw_obj.link_id.split("_", 1)[-1]
+    return praw_obj.id
+
+
+def throttle_stream(
+    stream,
+    interval,
+    stop_event=None,
+    page_size=resources.STREAM_PAGE_SIZE,
+    name=None,
+):
+    """
+    Yield from a PRAW stream (created with pause_after), but wait up to
+    interval seconds after each pause before polling it again.
+
+    The wait is shortened when items arrive faster than half of page_size
+    per wait, based on the rate since the previous pause, since a poll
+    only returns a page of the newest items. Windows with a full page of
+    items, which may have missed some, are logged.
+
+    Stops waiting early if stop_event is provided and gets set.
+    """
+    wait = None  # until the stream's initial backlog has been read
+    count = 0
+    resumed = time.monotonic()
+    for item in stream:
+        yield item
+        if item is not None:
+            count += 1
+            continue
+
+        if wait is None:
+            wait = interval
+        else:
+            window = wait + time.monotonic() - resumed
+            if count >= page_size:
+                resources.LOGGER.warning(
+                    "{} stream got {} items in {:.0f}s, a full page may "
+                    "have missed some".format(
+                        name or "Throttled", count, window
+                    )
+                )
+            wait = interval
+            if count:
+                wait = min(interval, window * (page_size / 2) / count)
+        count = 0
+
+        if stop_event is not None:
+            stop_event.wait(wait)
+        else:
+            time.sleep(wait)
+        resumed = time.monotonic()
+
+
+def skip_seen(stream, seen_until, seen_last=()):
+    """
+    Yield from a PRAW stream, but drop the items created before seen_until
+    (a created_utc timestamp), and those created at seen_until whose
+    fullname is in seen_last. Used to skip the backlog a new stream starts
+    with, when a previous run has already taken care of it.
+    """
+    seen_last = set(seen_last)
+    for item in stream:
+        if item is not None:
+            if item.created_utc < seen_until:
+                continue
+            if item.created_utc == seen_until and item.fullname in seen_last:
+                continue
+        yield item
+
+
 def raise_on_exception(e):
     """Raises exception e"""
     raise e
 
 
-def load_queue(queue, iterable, stop_event=None):
+def load_queue(
+    queue, iterable, stop_event=None, monitor=None, subreddit_filter=None
+):
     """Put items from iterable into queue as they become available
 
-    Stops when stop_event is set if provided, else continues forever.
+    Items are wrapped in a QueuedItem, tagged with the name of the
+    monitor (if any) and the time they were read from the iterable.
+
+    Blocks while the queue is full. Stops when stop_event is set if
+    provided, else continues forever.
 
     If the item is None, it will be skipped. This can be used to more
     regularly check for stop_event being set (pass None though the
     iterator to check the event and then continue iterating).
+
+    If a monitor.StreamMonitor is provided, it is informed of every item,
+    and the iterable is replaced by a new one from the monitor whenever it
+    requests a restart.
+
+    If a stats.SubredditFilter is provided, items from subreddits it
+    doesn't accept are dropped rather than queued.
     """
+    name = monitor.name if monitor is not None else None
+
     while not stop_event.is_set():
+        if monitor is not None and monitor.restart_requested():
+            iterable = monitor.restart()
+
         for i in iterable:
             if i is None or stop_event.is_set():
                 break
 
-            while not stop_event.is_set():
-                try:
-                    queue.put(i, timeout=1.0)
-                    resources.LOGGER.debug("Queued item {}".format(i))
-                    break
-                except Full:
-                    resources.LOGGER.warn("Destination queue is full")
+            if monitor is not None:
+                monitor.record_item()
+
+            if subreddit_filter is not None and not subreddit_filter.accepts(
+                praw_object_subreddit(i)
+            ):
+                continue
+
+            item = QueuedItem(i, name, time.time())
+            try:
+                queue.put_nowait(item)
+            except Full:
+                resources.LOGGER.warning("Destination queue is full")
+                queue.put(item)
+            resources.LOGGER.debug("Queued item {}".format(i))
+
+            if monitor is not None and monitor.restart_requested():
+                break
 
     resources.LOGGER.info("Stop signal received, stopping")
+
+
+def notify_exit(queue, target, *args):
+    """
+    Call target(*args), and put a WorkerExit with the name of the current
+    thread on queue when it returns or raises. Lets the consumer of queue
+    block on it, rather than poll the worker threads.
+    """
+    try:
+        target(*args)
+    finally:
+        queue.put(WorkerExit(threading.current_thread().name))
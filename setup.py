@@ -13,7 +13,7 @@ setup(
     author_email="john@johnpaton.net",
     url="https://github.com/JohnPaton/nbviewerbot",
     packages=["nbviewerbot"],
-    install_requires=["praw", "bs4", "python-dotenv", "click", "backoff"],
+    install_requires=["praw", "python-dotenv", "click", "backoff", "requests"],
     python_requires=">=3.4",
     entry_points={
         "console_scripts": ["nbviewerbot = nbviewerbot.nbviewerbot:cli"]
@@ -0,0 +1,140 @@
+import time
+
+import praw
+import praw.models
+import pytest
+
+import nbviewerbot.nbviewerbot as bot
+from nbviewerbot.accounts import TokenBucket, ReplyPool
+
+
+class FakeUser:
+    def __init__(self, name):
+        self.name = name
+
+    def me(self):
+        return self
+
+
+class FakeReddit:
+    """Wraps a real (unauthenticated) praw.Reddit with a fixed username"""
+
+    def __init__(self, name):
+        self.user = FakeUser(name)
+        self._reddit = praw.Reddit(
+            client_id="id", client_secret="secret", user_agent="test"
+        )
+
+    def comment(self, id):
+        return self._reddit.comment(id=id)
+
+    def submission(self, id):
+        return self._reddit.submission(id=id)
+
+
+@pytest.fixture
+def reddit():
+    return praw.Reddit(client_id="id", client_secret="secret", user_agent="t")
+
+
+def comment(reddit, comment_id, thread_id):
+    return praw.models.Comment(
+        reddit, _data={"id": comment_id, "link_id": "t3_" + thread_id}
+    )
+
+
+class TestTokenBucket:
+    def test_burst(self):
+        bucket = TokenBucket(rate=0.001, capacity=3)
+        assert all(bucket.acquire(block=False) for _ in range(3))
+        assert not bucket.acquire(block=False)
+
+    def test_time_to_token(self):
+        bucket = TokenBucket(rate=0.5, capacity=1)
+        assert bucket.time_to_token() == 0
+        bucket.acquire()
+        assert 1.9 < bucket.time_to_token() <= 2
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        assert bucket.acquire(block=False)
+        start = time.monotonic()
+        assert bucket.acquire()
+        assert 0.01 < time.monotonic() - start < 0.5
+
+
+class TestReplyPool:
+    def test_usernames(self):
+        pool = ReplyPool([FakeReddit("Bot1"), FakeReddit("bot2")])
+        assert pool.usernames == {"bot1", "bot2"}
+
+    def test_requires_account(self):
+        with pytest.raises(ValueError):
+            ReplyPool([])
+
+    def test_pins_threads(self, reddit):
+        pool = ReplyPool([FakeReddit("bot{}".format(i)) for i in range(4)])
+        for thread_id in ["a1", "b2", "c3", "d4", "e5"]:
+            submission = reddit.submission(id=thread_id)
+            account = pool.account_for(submission)
+            for i in range(5):
+                c = comment(reddit, "c{}".format(i), thread_id)
+                assert pool.account_for(c) is account
+
+    def test_spreads_threads(self, reddit):
+        pool = ReplyPool([FakeReddit("bot{}".format(i)) for i in range(4)])
+        used = {
+            pool.account_for(reddit.submission(id="s{}".format(i))).username
+            for i in range(100)
+        }
+        assert len(used) == 4
+
+    def test_acquire(self, reddit):
+        pool = ReplyPool([FakeReddit("bot1"), FakeReddit("bot2")])
+        c = comment(reddit, "c1", "s1")
+        target = pool.acquire(c)
+        assert isinstance(target, praw.models.Comment)
+        assert target.id == "c1"
+        assert target._reddit is pool.account_for(c).reddit._reddit
+
+    def test_acquire_nonblocking(self, reddit):
+        pool = ReplyPool(
+            [FakeReddit("bot1"), FakeReddit("bot2")], rate=0.001, burst=1
+        )
+        c = comment(reddit, "c1", "s1")
+        assert pool.acquire(c, block=False) is not None
+        assert pool.acquire(c, block=False) is None
+        assert pool.time_to_reply(c) > 100
+
+        # the other account isn't held up
+        other = next(
+            comment(reddit, "c2", "s{}".format(i))
+            for i in range(100)
+            if pool.account_for(comment(reddit, "c2", "s{}".format(i)))
+            is not pool.account_for(c)
+        )
+        assert pool.acquire(other, block=False) is not None
+
+    def test_single_account_unlimited(self, reddit):
+        pool = ReplyPool([FakeReddit("bot1")], rate=0.001, burst=1)
+        c = comment(reddit, "c1", "s1")
+        assert all(pool.acquire(c, block=False) for _ in range(10))
+        assert pool.time_to_reply(c) == 0
+
+
+class TestSendReply:
+    def test_deferred(self, reddit, monkeypatch):
+        posted = []
+        monkeypatch.setattr(
+            bot, "post_reply", lambda target, text: posted.append(text)
+        )
+        pool = ReplyPool(
+            [FakeReddit("bot1"), FakeReddit("bot2")], rate=0.001, burst=1
+        )
+        c = comment(reddit, "c1", "s1")
+        bot.send_reply(c, "first", pool.usernames, pool=pool)
+        with pytest.raises(bot.ReplyDeferred) as e:
+            bot.send_reply(c, "second", pool.usernames, pool=pool)
+        assert e.value.text == "second"
+        assert e.value.wait > 100
+        assert posted == ["first"]
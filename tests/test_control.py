@@ -0,0 +1,126 @@
+import os
+import socket
+
+import pytest
+
+from nbviewerbot import control
+from nbviewerbot.control import ControlServer, BotNotRunning, send_command
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    # Unix socket paths are limited to ~100 characters
+    path = os.path.join(str(tmp_path), "bot.sock")
+    if len(path) > 100:
+        pytest.skip("tmp path too long for a Unix socket")
+    return path
+
+
+@pytest.fixture
+def server(socket_path):
+    commands = {
+        "ping": lambda: {"ok": True},
+        "status": lambda: {"queue_depth": 3},
+        "fail": lambda: 1 / 0,
+    }
+    server = ControlServer(socket_path, commands)
+    server.start()
+    yield server
+    server.close()
+
+
+class TestControlServer:
+    def test_commands(self, server, socket_path):
+        assert send_command(socket_path, "ping") == {"ok": True}
+        assert send_command(socket_path, "status") == {"queue_depth": 3}
+
+    def test_unknown_command(self, server, socket_path):
+        assert "error" in send_command(socket_path, "dance")
+
+    def test_failing_command(self, server, socket_path):
+        assert "division by zero" in send_command(socket_path, "fail")["error"]
+
+    def test_close_removes_socket(self, socket_path):
+        server = ControlServer(socket_path, {})
+        server.start()
+        assert os.path.exists(socket_path)
+        server.close()
+        assert not os.path.exists(socket_path)
+
+    def test_already_running(self, server, socket_path):
+        with pytest.raises(RuntimeError):
+            ControlServer(socket_path, {})
+
+    def test_stale_socket(self, socket_path):
+        # socket file left behind by a crashed bot
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(socket_path)
+        sock.close()
+        assert os.path.exists(socket_path)
+
+        server = ControlServer(socket_path, {"ping": lambda: {"ok": True}})
+        server.start()
+        try:
+            assert send_command(socket_path, "ping") == {"ok": True}
+        finally:
+            server.close()
+
+
+def test_send_command_not_running(socket_path):
+    with pytest.raises(BotNotRunning):
+        send_command(socket_path, "status")
+
+
+class TestReadPid:
+    def test_missing(self, tmp_path):
+        assert control.read_pid(str(tmp_path / "bot.pid")) is None
+
+    def test_running(self, tmp_path):
+        pidfile = tmp_path / "bot.pid"
+        pidfile.write_text(str(os.getpid()))
+        assert control.read_pid(str(pidfile)) == os.getpid()
+
+    def test_not_running(self, tmp_path, monkeypatch):
+        def kill(pid, sig):
+            raise ProcessLookupError
+
+        monkeypatch.setattr(control.os, "kill", kill)
+        pidfile = tmp_path / "bot.pid"
+        pidfile.write_text("12345")
+        assert control.read_pid(str(pidfile)) is None
+
+    def test_garbage(self, tmp_path):
+        pidfile = tmp_path / "bot.pid"
+        pidfile.write_text("not a pid")
+        assert control.read_pid(str(pidfile)) is None
+
+
+class TestCreatePidfile:
+    def test_exclusive(self, tmp_path):
+        pidfile = str(tmp_path / "bot.pid")
+        os.close(control._create_pidfile(pidfile))
+        # created, but its pid not written yet
+        with pytest.raises(RuntimeError, match="already starting"):
+            control._create_pidfile(pidfile)
+
+    def test_running(self, tmp_path):
+        pidfile = tmp_path / "bot.pid"
+        pidfile.write_text(str(os.getpid()))
+        with pytest.raises(RuntimeError, match="already running"):
+            control._create_pidfile(str(pidfile))
+
+    def test_stale(self, tmp_path, monkeypatch):
+        def kill(pid, sig):
+            raise ProcessLookupError
+
+        monkeypatch.setattr(control.os, "kill", kill)
+        pidfile = tmp_path / "bot.pid"
+        pidfile.write_text("12345")
+        os.close(control._create_pidfile(str(pidfile)))
+        assert pidfile.read_text() == ""
+
+    def test_abandoned_start(self, tmp_path, monkeypatch):
+        pidfile = tmp_path / "bot.pid"
+        pidfile.write_text("")
+        monkeypatch.setattr(control.resources, "PIDFILE_START_TIMEOUT", 0)
+        os.close(control._create_pidfile(str(pidfile)))
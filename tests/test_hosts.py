@@ -0,0 +1,95 @@
+import re
+
+from nbviewerbot import hosts, templating, utils
+
+
+class TestRegistry:
+    def test_known_hosts(self):
+        for netloc in [
+            "github.com",
+            "raw.githubusercontent.com",
+            "gist.github.com",
+            "gist.githubusercontent.com",
+            "gitlab.com",
+            "bitbucket.org",
+        ]:
+            assert hosts.get_host(netloc) is not None
+
+    def test_unknown_host(self):
+        assert hosts.get_host("example.com") is None
+        assert utils.classify_links(["https://example.com/a/b/c.ipynb"]) == []
+
+    def test_register(self, monkeypatch):
+        monkeypatch.setattr(hosts, "HOSTS", dict(hosts.HOSTS))
+        hosts.register(
+            "git.example.com",
+            hosts.NotebookHost(
+                matcher=re.compile(r"/(?P<repo>[^/]+)/(?P<filepath>.+\.ipynb)"),
+                nbviewer_path=lambda netloc, path, groups: netloc + path,
+                binder_spec=lambda repo: ("git", repo),
+            ),
+        )
+        (link,) = utils.classify_links(["https://git.example.com/r/nb.ipynb"])
+        assert link.repo == "r"
+        assert link.branch == "master"
+        assert templating.binder_url_for_link(link) == (
+            "https://mybinder.org/v2/git/r/master?filepath=nb.ipynb"
+        )
+
+
+class TestGitLab:
+    url = "https://gitlab.com/group/sub/repo/-/blob/dev/dir/nb.ipynb"
+
+    def test_classify(self):
+        (link,) = utils.classify_links([self.url])
+        assert link.host == "gitlab.com"
+        assert link.repo == "group/sub/repo"
+        assert link.branch == "dev"
+        assert link.filepath == "dir/nb.ipynb"
+
+    def test_old_layout(self):
+        url = "https://gitlab.com/user/repo/blob/dev/nb.ipynb"
+        (link,) = utils.classify_links([url])
+        assert link.repo == "user/repo"
+
+    def test_urls(self):
+        assert templating.nbviewer_url(self.url) == (
+            "https://nbviewer.jupyter.org/url/"
+            "gitlab.com/group/sub/repo/-/raw/dev/dir/nb.ipynb"
+        )
+        assert templating.binder_url_for_link(self.url) == (
+            "https://mybinder.org/v2/gl/group%2Fsub%2Frepo/dev"
+            "?filepath=dir%2Fnb.ipynb"
+        )
+
+
+class TestBitbucket:
+    url = "https://bitbucket.org/user/repo/src/dev/nb.ipynb"
+
+    def test_classify(self):
+        (link,) = utils.classify_links([self.url])
+        assert link.host == "bitbucket.org"
+        assert link.repo == "user/repo"
+        assert link.branch == "dev"
+        assert link.filepath == "nb.ipynb"
+
+    def test_urls(self):
+        assert templating.nbviewer_url(self.url) == (
+            "https://nbviewer.jupyter.org/url/"
+            "bitbucket.org/user/repo/raw/dev/nb.ipynb"
+        )
+        assert templating.binder_url_for_link(self.url) == (
+            "https://mybinder.org/v2/git/"
+            "https%3A%2F%2Fbitbucket.org%2Fuser%2Frepo/dev?filepath=nb.ipynb"
+        )
+
+
+class TestNonNotebooks:
+    def test_no_notebook(self):
+        urls = [
+            "https://gitlab.com/user/repo/-/blob/dev/README.md",
+            "https://bitbucket.org/user/repo/src/dev/script.py",
+            "https://github.com/user/repo",
+            "mailto:someone@example.com",
+        ]
+        assert utils.classify_links(urls) == []
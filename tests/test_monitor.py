@@ -0,0 +1,94 @@
+import threading
+
+from nbviewerbot import monitor
+from nbviewerbot.monitor import StreamMonitor, LatencyTracker
+
+
+def stalled_stream():
+    while True:
+        yield None
+
+
+class TestStreamMonitor:
+    def test_rate(self):
+        m = StreamMonitor("test", stalled_stream)
+        assert m.rate() is None
+        for t in range(0, 100, 2):
+            m.record_item(now=t)
+        assert m.rate() == 0.5
+        assert m.quiet_for(now=110) == 12
+
+    def test_stalled(self):
+        m = StreamMonitor("test", stalled_stream, stall_factor=10, min_quiet=5)
+        for t in range(5):
+            m.record_item(now=t)
+        # not enough items yet to judge
+        assert not m.is_stalled(now=1000)
+
+        for t in range(5, 20):
+            m.record_item(now=t)
+        assert not m.is_stalled(now=25)
+        assert m.is_stalled(now=35)
+
+    def test_min_quiet(self):
+        m = StreamMonitor("test", stalled_stream, stall_factor=10, min_quiet=60)
+        for t in range(20):
+            m.record_item(now=t)
+        assert not m.is_stalled(now=50)
+        assert m.is_stalled(now=90)
+
+    def test_restart(self):
+        m = StreamMonitor("test", lambda: iter([1, 2]))
+        assert not m.restart_requested()
+        m.request_restart()
+        assert m.restart_requested()
+        assert list(m.restart()) == [1, 2]
+        assert not m.restart_requested()
+        assert m.restarts == 1
+
+
+class TestWatchdog:
+    def test_requests_restart(self):
+        m = StreamMonitor("test", stalled_stream, min_quiet=0, min_items=1)
+        m.record_item(now=0)
+        m.record_item(now=1)
+
+        stop_event = threading.Event()
+
+        class Monitor:
+            def is_stalled(self):
+                stop_event.set()  # only run one check
+                return m.is_stalled()
+
+            def __getattr__(self, name):
+                return getattr(m, name)
+
+        monitor.watchdog([Monitor()], stop_event, interval=0)
+        assert m.restart_requested()
+
+
+class TestLatencyTracker:
+    def test_empty(self):
+        summary = LatencyTracker().summary()
+        assert summary["replies"] == 0
+        assert summary["p50"] is None
+
+    def test_summary(self):
+        tracker = LatencyTracker(maxlen=100, slo=50)
+        for latency in range(1, 101):
+            tracker.record(created=0, ingested=1, replied=latency)
+        summary = tracker.summary()
+        assert summary["replies"] == 100
+        assert summary["p50"] == 50
+        assert summary["p95"] == 95
+        assert summary["max"] == 100
+        assert summary["ingest_p50"] == 1
+        assert summary["within_slo"] == 0.5
+        assert tracker.last_reply == 100
+
+    def test_window(self):
+        tracker = LatencyTracker(maxlen=10)
+        for latency in range(100):
+            tracker.record(created=0, ingested=0, replied=latency)
+        assert tracker.summary()["replies"] == 10
+        assert tracker.summary()["p50"] == 94
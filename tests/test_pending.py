@@ -0,0 +1,227 @@
+import collections
+import queue
+import threading
+import time
+
+import prawcore.exceptions
+import pytest
+
+import nbviewerbot.nbviewerbot as bot
+from nbviewerbot import utils
+from nbviewerbot.pending import PendingWork, stream_scope
+from nbviewerbot.utils import QueuedItem
+
+
+class FakeThing:
+    def __init__(self, fullname, created_utc=0):
+        self.fullname = fullname
+        self.created_utc = created_utc
+
+
+class FakeReddit:
+    def __init__(self, error=None):
+        self.requested = []
+        self.error = error
+
+    def info(self, fullnames):
+        self.requested.append(fullnames)
+        if self.error is not None:
+            raise self.error
+        # Reddit doesn't return deleted items
+        return (FakeThing(f) for f in fullnames if f != "t1_deleted")
+
+
+def queued(fullname, stream="Comment", ingested=0, created_utc=0):
+    return QueuedItem(FakeThing(fullname, created_utc), stream, ingested)
+
+
+class TestPendingWork:
+    def test_mark_seen(self):
+        pending = PendingWork()
+        pending.mark_seen(queued("t1_a", created_utc=10))
+        pending.mark_seen(queued("t1_b", created_utc=5))
+        pending.mark_seen(queued("t3_c", stream="Submission", created_utc=7))
+        pending.mark_seen(queued("t1_d", stream=None, created_utc=20))
+        pending.mark_seen(queued("t1_e", created_utc=10))
+        assert pending.seen_until == {"Comment": 10, "Submission": 7}
+        assert pending.seen_last == {
+            "Comment": {"t1_a", "t1_e"},
+            "Submission": {"t3_c"},
+        }
+
+    def test_roundtrip(self, tmp_path):
+        path = str(tmp_path / "pending.json")
+        items = [
+            queued("t3_b", "Submission", ingested=2),
+            queued("t1_a", ingested=1),
+            queued("t1_deleted", ingested=3),
+        ]
+        PendingWork(items, {"Comment": 10}, {"Comment": ["t1_x"]}).save(path)
+
+        reddit = FakeReddit()
+        pending = PendingWork.load(reddit, path)
+        assert reddit.requested == [["t3_b", "t1_a", "t1_deleted"]]
+        assert [
+            (i.obj.fullname, i.stream, i.ingested) for i in pending.items
+        ] == [
+            ("t1_a", "Comment", 1),
+            ("t3_b", "Submission", 2),
+        ]
+        assert pending.seen_until == {"Comment": 10}
+        assert pending.seen_last == {"Comment": {"t1_x"}}
+
+        # only resumed once
+        assert not (tmp_path / "pending.json").exists()
+        assert PendingWork.load(reddit, path).items == []
+
+    def test_load_nothing_pending(self, tmp_path):
+        path = str(tmp_path / "pending.json")
+        PendingWork([], {"Comment": 10}).save(path)
+
+        reddit = FakeReddit()
+        pending = PendingWork.load(reddit, path)
+        assert pending.items == []
+        assert pending.seen_until == {"Comment": 10}
+        assert reddit.requested == []
+
+    def test_restart_skips_ingested(self, tmp_path):
+        path = str(tmp_path / "pending.json")
+        stream = [
+            FakeThing("t1_a", 1),
+            FakeThing("t1_b", 2),
+            FakeThing("t1_c", 2),
+            FakeThing("t1_d", 3),
+        ]
+        pending = PendingWork(scopes={"Comment": stream_scope(["a"])})
+        # t1_a was handled, t1_b still queued on shutdown (as main does)
+        pending.mark_seen(QueuedItem(stream[0], "Comment", 0))
+        pending.items = [QueuedItem(stream[1], "Comment", 0)]
+        for item in pending.items:
+            pending.mark_seen(item)
+        pending.save(path)
+
+        pending = PendingWork.load(FakeReddit(), path)
+        pending.set_scopes({"Comment": stream_scope(["a"])})
+        assert [i.obj.fullname for i in pending.items] == ["t1_b"]
+        resumed = utils.skip_seen(
+            iter(stream),
+            pending.seen_until["Comment"],
+            pending.seen_last["Comment"],
+        )
+        assert [i.fullname for i in resumed] == ["t1_c", "t1_d"]
+
+    def test_scopes(self, tmp_path):
+        path = str(tmp_path / "pending.json")
+        scopes = {
+            "Comment": stream_scope(["a", "b"]),
+            "Submission": stream_scope(["a", "b"]),
+            "SlowComment": stream_scope(["c"]),
+        }
+        seen_until = {"Comment": 10, "Submission": 7, "SlowComment": 3}
+        PendingWork(seen_until=seen_until, scopes=scopes).save(path)
+
+        # "b" moved to the slow streams, "Submission" reads the same
+        pending = PendingWork.load(FakeReddit(), path)
+        pending.set_scopes(
+            {
+                "Comment": stream_scope(["a"]),
+                "Submission": stream_scope(["B", "a"]),
+                "SlowComment": stream_scope(["b", "c"]),
+            }
+        )
+        assert pending.seen_until == {"Submission": 7}
+
+    def test_unscoped_positions_dropped(self, tmp_path):
+        # saved before scopes were recorded
+        pending = PendingWork(seen_until={"Comment": 10})
+        pending.set_scopes({"Comment": stream_scope(["a"])})
+        assert pending.seen_until == {}
+
+    def test_load_reddit_down(self, tmp_path):
+        path = str(tmp_path / "pending.json")
+        PendingWork([queued("t1_a")], {"Comment": 10}).save(path)
+
+        error = prawcore.exceptions.RequestException(OSError(), (), {})
+        with pytest.raises(prawcore.exceptions.RequestException):
+            PendingWork.load(FakeReddit(error), path)
+        # kept for the next start
+        pending = PendingWork.load(FakeReddit(), path)
+        assert [i.obj.fullname for i in pending.items] == ["t1_a"]
+
+    def test_load_corrupt(self, tmp_path):
+        path = tmp_path / "pending.json"
+        path.write_text("{not json")
+        assert PendingWork.load(FakeReddit(), str(path)).items == []
+        assert not path.exists()
+
+
+class TestDrain:
+    def test_drains_backlog_then_queue(self):
+        q = queue.Queue()
+        q.put(queued("t1_b"))
+        backlog = collections.deque([queued("t1_a")])
+        handled = []
+
+        handle = lambda i: handled.append(i.obj.fullname)
+        bot.drain(q, backlog, set(), handle, 5)
+        assert handled == ["t1_a", "t1_b"]
+        assert not backlog
+
+    def test_waits_for_workers(self):
+        q = queue.Queue()
+        handled = []
+
+        def last_item():
+            time.sleep(0.2)
+            q.put(queued("t1_b"))
+
+        worker = threading.Thread(
+            name="CommentWorker",
+            target=utils.notify_exit,
+            args=(q, last_item),
+        )
+        worker.start()
+        q.put(queued("t1_a"))
+        bot.drain(
+            q,
+            collections.deque(),
+            {"CommentWorker"},
+            lambda i: handled.append(i.obj.fullname),
+            5,
+        )
+        assert handled == ["t1_a", "t1_b"]
+        assert q.empty()
+
+    def test_deadline(self):
+        q = queue.Queue()
+        for name in ["t1_a", "t1_b", "t1_c"]:
+            q.put(queued(name))
+        backlog = collections.deque([queued("t1_x")])
+        handled = []
+
+        bot.drain(q, backlog, set(), handled.append, 0)
+        assert handled == []
+        names = [i.obj.fullname for i in backlog]
+        assert names == ["t1_x", "t1_a", "t1_b", "t1_c"]
+
+    @pytest.mark.parametrize("error", [KeyboardInterrupt, ValueError])
+    def test_interrupted(self, error):
+        q = queue.Queue()
+        for name in ["t1_a", "t1_b", "t1_c"]:
+            q.put(queued(name))
+        backlog = collections.deque()
+        handled = []
+
+        def handle(item):
+            if item.obj.fullname == "t1_b":
+                raise error
+            handled.append(item.obj.fullname)
+
+        bot.drain(q, backlog, set(), handle, 5)
+        assert handled == ["t1_a"]
+        names = [i.obj.fullname for i in backlog]
+        if error is KeyboardInterrupt:
+            # the interrupted item is kept
+            assert names == ["t1_b", "t1_c"]
+        else:
+            assert names == ["t1_c"]
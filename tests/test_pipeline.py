@@ -0,0 +1,116 @@
+"""Micro-benchmark of the handoff from the stream workers to the main loop.
+
+Measures the time from a stream yielding an item until a consumer blocked
+on the queue receives it. Run with -s to see the numbers:
+
+    pytest tests/test_pipeline.py -s
+
+The latency bounds are only checked when the NBVIEWERBOT_BENCH_ASSERT
+environment variable is set, as timings are unreliable on busy machines:
+
+    NBVIEWERBOT_BENCH_ASSERT=1 pytest tests/test_pipeline.py -s
+"""
+
+import os
+import queue
+import threading
+import time
+
+import pytest
+
+from nbviewerbot import utils
+
+HANDOFF_ITEMS = 200
+HANDOFF_INTERVAL = 0.002  # seconds between items, so the consumer idles
+
+BENCH_ASSERT = bool(os.environ.get("NBVIEWERBOT_BENCH_ASSERT"))
+MAX_MEDIAN_HANDOFF = 0.005
+MAX_HANDOFF = 0.1
+
+
+class Stamped:
+    def __init__(self, n):
+        self.n = n
+        self.yielded = time.perf_counter()
+
+
+def stamped_stream(n_items, interval, stop_event):
+    for n in range(n_items):
+        time.sleep(interval)
+        yield Stamped(n)
+    stop_event.set()
+    yield None
+
+
+def test_handoff_latency():
+    q = queue.Queue(1024)
+    stop_event = threading.Event()
+    worker = threading.Thread(
+        name="BenchWorker",
+        target=utils.notify_exit,
+        args=(
+            q,
+            utils.load_queue,
+            q,
+            stamped_stream(HANDOFF_ITEMS, HANDOFF_INTERVAL, stop_event),
+            stop_event,
+        ),
+    )
+    worker.start()
+
+    latencies = []
+    while True:
+        item = q.get()
+        received = time.perf_counter()
+        if isinstance(item, utils.WorkerExit):
+            break
+        latencies.append(received - item.obj.yielded)
+    worker.join()
+
+    assert item.name == "BenchWorker"
+    assert len(latencies) == HANDOFF_ITEMS
+    latencies.sort()
+    median = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        "\nHandoff latency over {} items: median {:.0f}us, p99 {:.0f}us, "
+        "max {:.0f}us".format(
+            len(latencies), median * 1e6, p99 * 1e6, latencies[-1] * 1e6
+        )
+    )
+    if BENCH_ASSERT:
+        assert median < MAX_MEDIAN_HANDOFF
+        assert latencies[-1] < MAX_HANDOFF
+
+
+def test_notify_exit_on_error():
+    q = queue.Queue()
+
+    def fail():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        utils.notify_exit(q, fail)
+    assert q.get_nowait() == utils.WorkerExit(
+        threading.current_thread().name
+    )
+
+
+def test_full_queue_blocks():
+    q = queue.Queue(1)
+    stop_event = threading.Event()
+
+    def items():
+        yield "a"
+        yield "b"
+        stop_event.set()
+        yield None
+
+    worker = threading.Thread(
+        target=utils.load_queue, args=(q, items(), stop_event)
+    )
+    worker.start()
+    assert q.get(timeout=1).obj == "a"
+    assert q.get(timeout=1).obj == "b"
+    worker.join(timeout=1)
+    assert not worker.is_alive()
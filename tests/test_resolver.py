@@ -0,0 +1,225 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from nbviewerbot import resolver as resolver_module
+from nbviewerbot.resolver import NotebookResolver, NotebookInfo
+
+NOTEBOOKS = {
+    "/repos/username/repo/contents/big.ipynb": 5000,
+    "/repos/username/repo/contents/small.ipynb": 10,
+}
+ETAG = '"abc123"'
+
+
+class StubGitHubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.etags.append(self.headers.get("If-None-Match"))
+        path = self.path.split("?")[0]
+
+        if self.server.rate_limit is not None:
+            status, headers = self.server.rate_limit
+            self.server.statuses.append(status)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        if path not in NOTEBOOKS:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        if self.headers.get("If-None-Match") == ETAG:
+            self.server.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.server.statuses.append(200)
+
+        body = json.dumps({"size": NOTEBOOKS[path]}).encode()
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), StubGitHubHandler)
+    httpd.requests = []
+    httpd.etags = []
+    httpd.statuses = []
+    httpd.rate_limit = None  # (status, headers) to answer with
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_resolver(server, **kwargs):
+    api_url = "http://127.0.0.1:{}".format(server.server_port)
+    kwargs.setdefault("cache_path", None)
+    return NotebookResolver(api_url=api_url, token="", **kwargs)
+
+
+BIG = "https://github.com/username/repo/blob/master/big.ipynb"
+SMALL = "https://github.com/username/repo/blob/master/small.ipynb"
+MISSING = "https://github.com/username/repo/blob/master/missing.ipynb"
+
+
+class TestNotebookResolver:
+    def test_lookup(self, server):
+        resolver = make_resolver(server)
+        assert resolver.lookup(BIG) == NotebookInfo(True, 5000)
+        assert resolver.lookup(MISSING) == NotebookInfo(False, None)
+        assert server.requests[0] == (
+            "/repos/username/repo/contents/big.ipynb?ref=master"
+        )
+
+    def test_not_github(self, server):
+        resolver = make_resolver(server)
+        assert resolver.lookup("https://example.com/a/b/c.ipynb") is None
+        assert resolver.lookup("https://github.com/username/repo") is None
+        assert server.requests == []
+
+    def test_cached(self, server):
+        resolver = make_resolver(server)
+        resolver.lookup(BIG)
+        resolver.lookup(BIG)
+        resolver.lookup(MISSING)
+        resolver.lookup(MISSING)
+        assert len(server.requests) == 2
+
+    def test_revalidates_stale(self, server):
+        resolver = make_resolver(server, ttl=-1)
+        assert resolver.lookup(BIG) == NotebookInfo(True, 5000)
+        assert resolver.lookup(BIG) == NotebookInfo(True, 5000)
+        assert server.etags == [None, ETAG]
+        assert server.statuses == [200, 304]
+
+    def test_negative_ttl(self, server):
+        resolver = make_resolver(server, negative_ttl=-1)
+        resolver.lookup(MISSING)
+        resolver.lookup(MISSING)
+        assert len(server.requests) == 2
+
+    def test_persists(self, server, tmpdir):
+        cache_path = str(tmpdir.join("cache.json"))
+        resolver = make_resolver(server, cache_path=cache_path)
+        resolver.lookup(BIG)
+        resolver.flush()
+        resolver = make_resolver(server, cache_path=cache_path)
+        assert resolver.lookup(BIG) == NotebookInfo(True, 5000)
+        assert len(server.requests) == 1
+
+    def test_debounces_writes(self, server, tmpdir):
+        cache = tmpdir.join("cache.json")
+        resolver = make_resolver(server, cache_path=str(cache))
+        resolver.lookup(BIG)
+        assert not cache.exists()
+
+        resolver = make_resolver(
+            server, cache_path=str(cache), flush_interval=0
+        )
+        resolver.lookup(BIG)
+        assert cache.exists()
+
+    def test_prunes_on_load(self, server, tmpdir):
+        cache = tmpdir.join("cache.json")
+        now = time.time()
+        entry = {"exists": True, "size": 1, "etag": ETAG}
+        cache.write(
+            json.dumps(
+                {
+                    "fresh": dict(entry, expires=now + 10),
+                    "stale": dict(entry, expires=now - 10),
+                    "old": dict(entry, expires=now - 100),
+                    "missing": {
+                        "exists": False,
+                        "size": None,
+                        "etag": None,
+                        "expires": now - 1,
+                    },
+                }
+            )
+        )
+        resolver = make_resolver(server, cache_path=str(cache), ttl=50)
+        assert set(resolver._cache) == {"fresh", "stale"}
+
+    def test_max_entries(self, server):
+        resolver = make_resolver(server, max_entries=1)
+        resolver.lookup(MISSING)
+        resolver.lookup(BIG)
+        assert len(resolver._cache) == 1
+        # the missing notebook expires first
+        resolver.lookup(BIG)
+        assert len(server.requests) == 2
+
+    def test_unreachable(self):
+        resolver = NotebookResolver(
+            cache_path=None, api_url="http://127.0.0.1:9", timeout=0.5
+        )
+        assert resolver.lookup(BIG) is None
+
+    def test_filter_links(self, server):
+        resolver = make_resolver(server, min_size=100)
+        links = [BIG, SMALL, MISSING, "https://gitlab.com/u/r/x.ipynb"]
+        expected = [BIG, "https://gitlab.com/u/r/x.ipynb"]
+        assert resolver.filter_links(links) == expected
+
+    def test_raw_link(self, server):
+        resolver = make_resolver(server)
+        url = "https://raw.githubusercontent.com/username/repo/dev/big.ipynb"
+        assert resolver.lookup(url) == NotebookInfo(True, 5000)
+        assert server.requests[0].endswith("big.ipynb?ref=dev")
+
+
+class TestRateLimit:
+    def test_rate_limit_reset(self, server, monkeypatch):
+        now = time.time()
+        resolver = make_resolver(server, ttl=-1)
+        assert resolver.lookup(BIG) == NotebookInfo(True, 5000)
+
+        server.rate_limit = (
+            403,
+            {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": now + 100},
+        )
+        # stale, but served from the cache while rate limited
+        assert resolver.lookup(BIG) == NotebookInfo(True, 5000)
+        assert resolver.lookup(SMALL) is None
+        assert resolver.lookup(MISSING) is None
+        assert server.statuses == [200, 403]
+
+        # looked up again once the limit resets
+        server.rate_limit = None
+        monkeypatch.setattr(resolver_module.time, "time", lambda: now + 101)
+        assert resolver.lookup(SMALL) == NotebookInfo(True, 10)
+        assert server.statuses == [200, 403, 200]
+
+    def test_retry_after(self, server):
+        server.rate_limit = (429, {"Retry-After": "100"})
+        resolver = make_resolver(server)
+        assert resolver.lookup(BIG) is None
+        assert resolver.lookup(SMALL) is None
+        assert server.statuses == [429]
+
+    def test_forbidden(self, server):
+        # not rate limited, e.g. a blocked repository
+        server.rate_limit = (403, {"X-RateLimit-Remaining": "42"})
+        resolver = make_resolver(server)
+        assert resolver.lookup(BIG) is None
+        assert resolver.lookup(SMALL) is None
+        assert server.statuses == [403, 403]
@@ -42,3 +42,28 @@ class TestSubredditsRelevant:
 
     def test_no_empty_strings(self):
         assert "" not in resources.SUBREDDITS_RELEVANT
+
+
+class TestGetRedditAuthKwargsPool:
+    def test_single(self):
+        dotenv.load_dotenv(DOTENV_PATH, override=True)
+        pool = resources.get_reddit_auth_kwargs_pool()
+        assert len(pool) == 1
+        assert pool[0]["username"] == "username"
+
+    def test_multiple(self, monkeypatch):
+        dotenv.load_dotenv(DOTENV_PATH, override=True)
+        for key in ["CLIENT_ID", "CLIENT_SECRET", "USERNAME", "PASSWORD"]:
+            monkeypatch.setenv(key + "_2", key.lower() + "2")
+
+        pool = resources.get_reddit_auth_kwargs_pool()
+        assert len(pool) == 2
+        assert pool[1]["username"] == "username2"
+        assert pool[1]["client_secret"] == "client_secret2"
+
+    def test_raises_if_incomplete(self, monkeypatch):
+        dotenv.load_dotenv(DOTENV_PATH, override=True)
+        monkeypatch.setenv("USERNAME_2", "username2")
+
+        with pytest.raises(KeyError):
+            resources.get_reddit_auth_kwargs_pool()
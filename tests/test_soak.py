@@ -0,0 +1,310 @@
+"""Soak test: run main() against a fast synthetic stream and check that
+memory, threads and the queue stay bounded.
+
+The run is time-compressed: items are generated as fast as the bot can
+process them, and the clock (time.time) advances SOAK_ITEM_INTERVAL
+simulated seconds per processed item, as does the items' created_utc. So
+time-bound state (cache TTLs, stats flushes, stream monitors) cycles as it
+would in a real run. By default this covers four hours of simulated
+traffic, which only takes a few seconds. For a longer run, set the
+NBVIEWERBOT_SOAK_HOURS environment variable, e.g.
+
+    NBVIEWERBOT_SOAK_HOURS=24 pytest tests/test_soak.py -s
+
+Items only appear on the streams once the clock reaches their
+created_utc, starting with a backlog of SOAK_BACKLOG items, and arrive
+at the rate the clock advances. So the queue holds about the backlog as
+long as the bot keeps up.
+
+Memory is checked by the slope of traced memory over the processed items,
+which catches leaks of a few hundred bytes per item; the top allocators
+since the warmup are listed on failure. test_detects_leak checks that it
+does.
+"""
+
+import functools
+import gc
+import itertools
+import logging
+import os
+import queue
+import resource
+import threading
+import time
+import tracemalloc
+
+import praw
+import praw.models
+import pytest
+
+import nbviewerbot.nbviewerbot as bot
+from nbviewerbot import accounts, utils
+from nbviewerbot.stats import SubredditStats
+
+SOAK_HOURS = float(os.environ.get("NBVIEWERBOT_SOAK_HOURS", 4))
+SOAK_ITEM_INTERVAL = 1.0  # simulated seconds between items
+SOAK_BACKLOG = 100  # items available when the streams start
+SOAK_SAMPLES = 40
+SOAK_WARMUP_SAMPLES = 8
+
+# Allowed growth of traced memory per processed item, in the steady state
+MAX_BYTES_PER_ITEM = 50
+
+# Allowed growth of the queue depth per processed item, and its maximum as
+# a fraction of the queue's maxsize, in the steady state
+MAX_QUEUE_SLOPE = 0.001
+MAX_QUEUE_FRACTION = 0.5
+
+# Size of the leak injected by test_detects_leak, per processed item
+INJECTED_LEAK_BYTES = 200
+
+SUBREDDITS = ["sub{}".format(i) for i in range(50)]
+NOTEBOOK_HTML = (
+    '<p>See <a href="https://github.com/username/repo/blob/master/'
+    '{}.ipynb">my notebook</a></p>'
+)
+OTHER_HTML = '<p>Some text <a href="https://example.com/{}">a link</a></p>'
+
+
+class FakeReply:
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeComment(praw.models.Comment):
+    def refresh(self):
+        return self
+
+    @property
+    def replies(self):
+        return []
+
+    @property
+    def submission(self):
+        return FakeSubmission(self._reddit, _data={"id": self.link_id[3:]})
+
+    def reply(self, body):
+        return FakeReply("r" + self.id)
+
+
+class FakeSubmission(praw.models.Submission):
+    @property
+    def comments(self):
+        return []
+
+    def reply(self, body):
+        return FakeReply("r" + self.id)
+
+
+class FakeUser:
+    name = "nbviewerbot"
+
+    def me(self):
+        return self
+
+
+class FakeReddit:
+    def __init__(self):
+        self.user = FakeUser()
+        self._reddit = praw.Reddit(
+            client_id="id", client_secret="secret", user_agent="soak"
+        )
+
+    def comment(self, id):
+        return FakeComment(self._reddit, _data={"id": id, "link_id": "t3_x"})
+
+    def submission(self, id):
+        return FakeSubmission(self._reddit, _data={"id": id})
+
+
+def fake_stream(reddit, kind, offset, n_items, stop_event, clock):
+    """Generate n_items comments or submissions as the clock reaches their
+    creation time, pausing (None) while there are none, or every 100 items,
+    like a PRAW stream. The two streams interleave their items (by offset 0
+    or 1), so that together they produce one per SOAK_ITEM_INTERVAL."""
+    start = clock.time() - SOAK_BACKLOG * SOAK_ITEM_INTERVAL
+    for i in range(n_items):
+        created = start + (2 * i + offset) * SOAK_ITEM_INTERVAL
+        while created > clock.time():
+            if stop_event.is_set():
+                return
+            time.sleep(0.001)
+            yield None
+
+        html = NOTEBOOK_HTML if i % 100 == 0 else OTHER_HTML
+        data = {
+            "id": "{}{}".format(kind[0], i),
+            "subreddit": SUBREDDITS[i % len(SUBREDDITS)],
+            "created_utc": created,
+        }
+        if kind == "comment":
+            data.update(body_html=html.format(i), link_id="t3_s{}".format(i))
+            yield FakeComment(reddit._reddit, _data=data)
+        else:
+            data.update(selftext_html=html.format(i), url="https://x.org")
+            yield FakeSubmission(reddit._reddit, _data=data)
+
+        if i % 100 == 99:
+            yield None
+
+    while not stop_event.is_set():
+        time.sleep(0.01)
+        yield None
+
+
+def rss_bytes():
+    """Current resident set size, or None if unavailable"""
+    try:
+        with open("/proc/self/statm") as h:
+            return int(h.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+
+class SimulatedClock:
+    """time.time() replacement, advanced explicitly"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def slope(xs, ys):
+    """Least squares slope of ys over xs"""
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    var = sum((x - mean_x) ** 2 for x in xs)
+    return cov / var
+
+
+def run_soak(monkeypatch, leak_bytes=0):
+    """Run main() over SOAK_HOURS of simulated traffic. Return the samples
+    taken along the way, the maximum size of the queue, and the top
+    allocators between the end of the warmup and the end of the run."""
+    total = int(SOAK_HOURS * 3600 / SOAK_ITEM_INTERVAL)
+    # per stream, so that the backlog lasts until the end
+    n_items = total // 2 + SOAK_BACKLOG
+    sample_every = total // SOAK_SAMPLES
+
+    reddit = FakeReddit()
+    clock = SimulatedClock()
+    done = threading.Event()
+    queues = []
+    samples = []
+    snapshots = []
+    leaked = []
+    processed = itertools.count(1)
+    process_praw_object = bot.process_praw_object
+
+    class RecordingQueue(queue.Queue):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            queues.append(self)
+
+    def get_stream_factories(subreddits, reddit_=None):
+        return (
+            functools.partial(
+                fake_stream, reddit, "comment", 0, n_items, done, clock
+            ),
+            functools.partial(
+                fake_stream, reddit, "submission", 1, n_items, done, clock
+            ),
+        )
+
+    def process_and_sample(praw_obj, *args, **kwargs):
+        reply = process_praw_object(praw_obj, *args, **kwargs)
+        clock.advance(SOAK_ITEM_INTERVAL)
+        if leak_bytes:
+            leaked.append(bytes(leak_bytes))
+        n = next(processed)
+        if n % sample_every == 0:
+            gc.collect()
+            samples.append(
+                {
+                    "processed": n,
+                    "traced": tracemalloc.get_traced_memory()[0],
+                    "rss": rss_bytes(),
+                    "threads": threading.active_count(),
+                    "queue": queues[0].qsize(),
+                }
+            )
+            if len(samples) in (SOAK_WARMUP_SAMPLES + 1, SOAK_SAMPLES):
+                snapshots.append(tracemalloc.take_snapshot())
+        if n == total:
+            done.set()
+            raise KeyboardInterrupt
+        return reply
+
+    monkeypatch.setattr(time, "time", clock.time)
+    monkeypatch.setattr(bot.mp, "Queue", RecordingQueue)
+    monkeypatch.setattr(bot, "get_stream_factories", get_stream_factories)
+    monkeypatch.setattr(bot, "process_praw_object", process_and_sample)
+    monkeypatch.setattr(bot.resources, "load_reddits", lambda: [reddit])
+    # keep pytest from capturing (and holding on to) every log record
+    monkeypatch.setattr(bot.resources.LOGGER, "propagate", False)
+    utils.setup_logger(None, None)
+    bot.resources.LOGGER.setLevel(logging.WARNING)
+
+    tracemalloc.start()
+    try:
+        bot.main(
+            SUBREDDITS,
+            stats=SubredditStats(path=None),
+            control_path=None,
+            pending_path=None,
+            shutdown_deadline=0,
+        )
+    finally:
+        tracemalloc.stop()
+        done.set()
+
+    assert len(samples) == SOAK_SAMPLES
+    top = snapshots[1].compare_to(snapshots[0], "lineno")[:10]
+    return samples, queues[0].maxsize, top
+
+
+def check_samples(samples, max_queue, top):
+    """Assert that the steady state samples show no growth"""
+    steady = samples[SOAK_WARMUP_SAMPLES:]
+    processed = [s["processed"] for s in steady]
+
+    per_item = slope(processed, [s["traced"] for s in steady])
+    assert per_item < MAX_BYTES_PER_ITEM, (
+        "Traced memory grew {:.0f} bytes per item. Top allocators:\n"
+        "{}".format(per_item, "\n".join(str(stat) for stat in top))
+    )
+
+    if steady[0]["rss"] is not None:
+        rss_per_item = slope(processed, [s["rss"] for s in steady])
+        assert rss_per_item < 4 * MAX_BYTES_PER_ITEM, (
+            "RSS grew {:.0f} bytes per item".format(rss_per_item)
+        )
+
+    assert len({s["threads"] for s in steady}) == 1
+
+    depths = [s["queue"] for s in steady]
+    queue_slope = slope(processed, depths)
+    assert queue_slope < MAX_QUEUE_SLOPE, (
+        "Queue grew {:.4f} items per item: {}".format(queue_slope, depths)
+    )
+    assert max(depths) < MAX_QUEUE_FRACTION * max_queue, (
+        "Queue backed up: {}".format(depths)
+    )
+
+
+def test_soak(monkeypatch):
+    check_samples(*run_soak(monkeypatch))
+
+
+def test_detects_leak(monkeypatch):
+    samples, max_queue, top = run_soak(monkeypatch, INJECTED_LEAK_BYTES)
+    with pytest.raises(AssertionError, match="bytes per item") as e:
+        check_samples(samples, max_queue, top)
+    # the injected leak is the top allocator
+    assert "test_soak.py" in str(e.value).split("\n")[1]
@@ -0,0 +1,142 @@
+import pytest
+
+import nbviewerbot.nbviewerbot as bot
+from nbviewerbot import stats
+from nbviewerbot.stats import SubredditStats
+
+
+class TestSubredditStats:
+    def test_record(self):
+        s = SubredditStats(path=None)
+        s.record("Python", "seen")
+        s.record("python", "seen", 2)
+        s.record("python", "hits")
+        assert s.get("python") == {
+            "seen": 3,
+            "hits": 1,
+            "replies": 0,
+            "forbidden": 0,
+        }
+        assert s.get("unknown")["seen"] == 0
+        assert s.subreddits() == ["python"]
+
+    def test_unknown_counter(self):
+        s = SubredditStats(path=None)
+        with pytest.raises(ValueError):
+            s.record("python", "likes")
+
+    def test_persists(self, tmpdir):
+        path = str(tmpdir.join("stats.json"))
+        s = SubredditStats(path=path, flush_interval=3600)
+        s.record("python", "seen")
+        assert SubredditStats(path=path).get("python")["seen"] == 0
+        s.flush()
+        assert SubredditStats(path=path).get("python")["seen"] == 1
+
+    def test_flush_interval(self, tmpdir):
+        path = str(tmpdir.join("stats.json"))
+        s = SubredditStats(path=path, flush_interval=0)
+        s.record("python", "seen")
+        assert SubredditStats(path=path).get("python")["seen"] == 1
+
+    def test_max_subreddits(self):
+        s = SubredditStats(path=None, max_subreddits=2)
+        s.record("python", "seen")
+        s.record("jupyter", "seen")
+        s.record("pics", "seen")
+        s.record("python", "seen")
+        assert sorted(s.subreddits()) == ["jupyter", "python"]
+        assert s.get("python")["seen"] == 2
+
+        # bans are always recorded
+        s.record("pics", "forbidden")
+        assert s.banned() == {"pics"}
+
+    def test_schedule(self):
+        s = SubredditStats(path=None)
+        s.record("hot", "seen", 1000)
+        s.record("hot", "hits", 100)
+        s.record("busy", "seen", 1000)
+        s.record("busy", "hits", 10)
+        s.record("quiet", "seen", 1000)
+        s.record("new", "seen", 10)
+        s.record("banned", "forbidden")
+
+        tiers = s.schedule(
+            ["hot", "busy", "quiet", "new", "banned"],
+            min_seen=100,
+            slow_yield=0.001,
+            hot_yield=0.05,
+        )
+        assert tiers == {
+            stats.HOT: ["hot"],
+            stats.FAST: ["busy", "new"],
+            stats.SLOW: ["quiet"],
+            stats.DROPPED: ["banned"],
+        }
+        assert s.banned() == {"banned"}
+
+
+class TestSubredditFilter:
+    def test_allow_all(self):
+        f = stats.SubredditFilter()
+        assert f.accepts("python")
+        assert f.accepts("pics")
+
+    def test_allowed(self):
+        f = stats.SubredditFilter(["Python", "jupyter"])
+        assert f.accepts("python")
+        assert not f.accepts("pics")
+
+    def test_blocked(self):
+        f = stats.SubredditFilter(["python", "jupyter"], blocked=["Jupyter"])
+        assert f.accepts("python")
+        assert not f.accepts("jupyter")
+
+    def test_block(self):
+        f = stats.SubredditFilter()
+        blocked = f.blocked
+        f.block("Python")
+        assert not f.accepts("python")
+        assert f.accepts("pics")
+        assert blocked == frozenset()  # replaced, not mutated
+
+
+class FakeStream:
+    def comments(self, **kwargs):
+        return "comments"
+
+    def submissions(self, **kwargs):
+        return "submissions"
+
+
+class FakeSubreddit:
+    def __init__(self, name):
+        self.name = name
+        self.stream = FakeStream()
+
+
+class FakeReddit:
+    def subreddit(self, name):
+        return FakeSubreddit(name)
+
+
+def test_scheduled_stream_factories():
+    s = SubredditStats(path=None)
+    s.record("hot", "seen", 1000)
+    s.record("hot", "hits", 100)
+    s.record("quiet", "seen", 1000)
+    s.record("banned", "forbidden")
+
+    factories = bot.get_scheduled_stream_factories(
+        ["hot", "new", "quiet", "banned"], FakeReddit(), s
+    )
+    assert sorted(factories) == [
+        "Comment",
+        "HotComment",
+        "HotSubmission",
+        "SlowComment",
+        "SlowSubmission",
+        "Submission",
+    ]
+    assert factories["HotComment"]() == "comments"
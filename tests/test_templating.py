@@ -0,0 +1,62 @@
+from nbviewerbot import templating, utils
+
+
+class TestNbviewerUrl:
+    def test_string(self):
+        url = "https://www.github.com/username/repo/blob/master/test.ipynb"
+        expected = (
+            "https://nbviewer.jupyter.org/url/"
+            "github.com/username/repo/blob/master/test.ipynb"
+        )
+        assert templating.nbviewer_url(url) == expected
+
+    def test_link(self):
+        url = "https://github.com/username/repo/blob/master/test.ipynb"
+        (link,) = utils.classify_links([url])
+        assert templating.nbviewer_url(link) == templating.nbviewer_url(url)
+
+
+class TestBinderUrl:
+    def test_no_filepath(self):
+        expected = "https://mybinder.org/v2/gh/username/repo/master"
+        assert templating.binder_url("username/repo") == expected
+
+    def test_filepath(self):
+        expected = (
+            "https://mybinder.org/v2/gh/username/repo/dev?filepath=a%2Fb.ipynb"
+        )
+        assert templating.binder_url("username/repo", "dev", "a/b.ipynb") == (
+            expected
+        )
+
+    def test_raw_link(self):
+        url = "https://raw.githubusercontent.com/username/repo/dev/b.ipynb"
+        expected = "https://mybinder.org/v2/gh/username/repo/dev?filepath=b.ipynb"
+        assert templating.binder_url_for_link(url) == expected
+
+    def test_gist_link(self):
+        rev = "0123456789abcdef0123456789abcdef01234567"
+        url = "https://gist.github.com/username/f00/raw/{}/n.ipynb".format(rev)
+        expected = "https://mybinder.org/v2/gist/username/f00/{}".format(rev)
+        expected += "?filepath=n.ipynb"
+        assert templating.binder_url_for_link(url) == expected
+
+
+class TestComment:
+    def test_single(self):
+        url = "https://github.com/username/repo/blob/master/test.ipynb"
+        text = templating.comment(url)
+        assert templating.nbviewer_url(url) in text
+        assert templating.binder_url_for_link(url) in text
+        assert templating.comment([url]) == text
+        assert templating.comment(utils.classify_links([url])) == text
+
+    def test_multi(self):
+        urls = [
+            "https://github.com/username/repo/blob/master/a.ipynb",
+            "https://github.com/username/repo/blob/master/b.ipynb",
+        ]
+        text = templating.comment(urls)
+        assert "Notebooks!" in text
+        for url in urls:
+            assert templating.nbviewer_url(url) in text
@@ -0,0 +1,226 @@
+import time
+
+import praw
+import praw.models
+import prawcore.exceptions
+import pytest
+
+import nbviewerbot.nbviewerbot as bot
+from nbviewerbot.threadcache import ThreadCache
+
+REDDIT = praw.Reddit(client_id="id", client_secret="secret", user_agent="test")
+
+
+class TreeComment(praw.models.Comment):
+    """A comment with replies, as found in a fetched tree"""
+
+    def __init__(self, id, parent_id, author, children=()):
+        super().__init__(
+            REDDIT,
+            _data={
+                "id": id,
+                "parent_id": parent_id,
+                "link_id": "t3_sub",
+                "author": author,
+            },
+        )
+        self.children = list(children)
+
+    @property
+    def replies(self):
+        return self.children
+
+
+class FakeSubmission(praw.models.Submission):
+    def __init__(self, id, comments, created_utc=0, top_comments=None):
+        super().__init__(REDDIT, _data={"id": id, "created_utc": created_utc})
+        self.tree = comments
+        self.top_tree = top_comments  # in the default sort, if different
+        self.fetches = 0
+
+    @property
+    def comments(self):
+        self.fetches += 1
+        if isinstance(self.tree, Exception):
+            raise self.tree
+        if self.comment_sort != "new" and self.top_tree is not None:
+            return self.top_tree
+        return self.tree
+
+
+class StreamComment(praw.models.Comment):
+    """A comment as read from a stream, which must not be refreshed"""
+
+    def __init__(self, id, submission, created_utc=0):
+        super().__init__(
+            REDDIT,
+            _data={
+                "id": id,
+                "link_id": submission.fullname,
+                "created_utc": created_utc,
+            },
+        )
+        self._fake_submission = submission
+
+    @property
+    def submission(self):
+        return self._fake_submission
+
+    def refresh(self):
+        raise AssertionError("refreshed {}".format(self.id))
+
+
+def thread():
+    """
+    sub
+    ├── a (alice)
+    │   └── a1 (nbviewerbot)
+    ├── b (bob)
+    │   └── b1 ([deleted])
+    └── <load more comments>
+    """
+    more = praw.models.MoreComments(REDDIT, {"children": ["x"], "count": 1})
+    return FakeSubmission(
+        "sub",
+        [
+            TreeComment(
+                "a",
+                "t3_sub",
+                "alice",
+                [TreeComment("a1", "t1_a", "NBviewerbot")],
+            ),
+            TreeComment(
+                "b", "t3_sub", "bob", [TreeComment("b1", "t1_b", "[deleted]")]
+            ),
+            more,
+        ],
+    )
+
+
+class TestThreadCache:
+    def test_siblings_share_fetch(self):
+        submission = thread()
+        cache = ThreadCache()
+        a = StreamComment("a", submission)
+        b = StreamComment("b", submission)
+
+        assert cache.repliers(a) == {"nbviewerbot"}
+        assert cache.repliers(b) == set()
+        # some of its replies are behind "load more comments"
+        assert cache.repliers(submission) is None
+        assert submission.fetches == 1
+        assert cache.summary() == {
+            "threads": 1,
+            "nodes": 4,
+            "hits": 2,
+            "fetches": 1,
+        }
+
+    def test_new_comment(self):
+        submission = thread()
+        cache = ThreadCache()
+        cache.repliers(StreamComment("a", submission))
+
+        new = StreamComment("c", submission, created_utc=time.time() + 20)
+        assert cache.repliers(new) == set()
+        cache.add_reply(new, "nbviewerbot")
+        assert cache.repliers(new) == {"nbviewerbot"}
+        assert submission.fetches == 1
+
+    def test_new_comment_clock_skew(self):
+        # may have been created before the fetch, by our clock
+        submission = thread()
+        cache = ThreadCache(clock_skew=10)
+        new = StreamComment("c", submission, created_utc=time.time() + 5)
+        assert cache.repliers(new) is None
+
+    def test_missing_comment(self):
+        # e.g. behind "load more comments"
+        cache = ThreadCache()
+        assert cache.repliers(StreamComment("x", thread())) is None
+
+    def test_more_replies(self):
+        # a's replies are partly behind "continue this thread"
+        more = praw.models.MoreComments(
+            REDDIT, {"children": [], "count": 0, "parent_id": "t1_a"}
+        )
+        submission = FakeSubmission(
+            "sub",
+            [
+                TreeComment("a", "t3_sub", "alice", [more]),
+                TreeComment("b", "t3_sub", "bob"),
+            ],
+        )
+        cache = ThreadCache()
+        assert cache.repliers(StreamComment("a", submission)) is None
+        assert cache.repliers(StreamComment("b", submission)) == set()
+        assert cache.repliers(submission) == {"alice", "bob"}
+
+    def test_own_replies_outlive_tree(self):
+        submission = thread()
+        cache = ThreadCache(ttl=0.1)
+        b = StreamComment("b", submission)
+        cache.add_reply(b, ["NBViewerBot"])
+        assert cache.repliers(b) == {"nbviewerbot"}
+
+        time.sleep(0.1)
+        assert cache.repliers(b) == set()
+        assert submission.fetches == 2
+
+    def test_max_nodes(self):
+        cache = ThreadCache(max_nodes=6)
+        first, second = thread(), thread()
+        second.id = "sub2"
+        cache.repliers(first)
+        cache.repliers(second)
+        assert cache.summary()["threads"] == 1
+
+        cache.repliers(first)
+        assert first.fetches == 2
+        assert cache.summary()["nodes"] == 4
+
+    def test_sorted_by_new(self):
+        # in a busy thread, a new comment is only on the first page of the
+        # tree when sorted by new
+        more = praw.models.MoreComments(REDDIT, {"children": ["c"], "count": 1})
+        submission = FakeSubmission(
+            "sub",
+            [TreeComment("c", "t3_sub", "carol"), more],
+            top_comments=[TreeComment("a", "t3_sub", "alice"), more],
+        )
+        cache = ThreadCache()
+        assert cache.repliers(StreamComment("c", submission)) == set()
+        assert submission.comment_sort == "new"
+
+    def test_fetch_error(self):
+        error = prawcore.exceptions.RequestException(OSError(), (), {})
+        submission = FakeSubmission("sub", error)
+        cache = ThreadCache()
+        assert cache.repliers(StreamComment("a", submission)) is None
+        assert cache.summary()["threads"] == 0
+
+
+class TestAlreadyReplied:
+    def test_cached(self):
+        submission = thread()
+        cache = ThreadCache()
+        a = StreamComment("a", submission)
+        b = StreamComment("b", submission)
+        assert bot.already_replied(a, ["other", "nbviewerbot"], cache)
+        assert not bot.already_replied(b, "nbviewerbot", cache)
+        assert submission.fetches == 1
+
+    def test_falls_back_to_refresh(self):
+        cache = ThreadCache()
+        with pytest.raises(AssertionError, match="refreshed x"):
+            bot.already_replied(StreamComment("x", thread()), "bot", cache)
+
+    def test_more_replies_falls_back_to_refresh(self):
+        # the bot's reply to a may be behind "continue this thread"
+        more = praw.models.MoreComments(REDDIT, {"children": [], "count": 0})
+        submission = FakeSubmission(
+            "sub", [TreeComment("a", "t3_sub", "alice", [more])]
+        )
+        cache = ThreadCache()
+        with pytest.raises(AssertionError, match="refreshed a"):
+            bot.already_replied(StreamComment("a", submission), "bot", cache)
@@ -1,6 +1,22 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
 import pytest
 from urllib.parse import urlparse
 from nbviewerbot import utils
+from nbviewerbot.monitor import StreamMonitor
+from nbviewerbot.stats import SubredditFilter
+
+Item = namedtuple("Item", ["subreddit"])
+
+
+def stalled_stream():
+    while True:
+        yield None
 
 
 class TestParseUrlIfNotParsed:
@@ -120,3 +136,261 @@ class TestGetGithubJupyterLinks:
         )
         links = utils.get_github_jupyter_links(html)
         assert links == []
+
+
+class TestClassifyLinks:
+    def test_github(self):
+        url = "https://www.github.com/username/repo/blob/dev/dir/test.ipynb"
+        (link,) = utils.classify_links([url])
+        assert link == utils.NotebookLink(
+            url=url,
+            host="github.com",
+            repo="username/repo",
+            branch="dev",
+            filepath="dir/test.ipynb",
+            path="github.com/username/repo/blob/dev/dir/test.ipynb",
+        )
+
+    def test_matches_get_github_info(self):
+        urls = [
+            "https://github.com/username/repo/test.ipynb",
+            "https://github.com/username/repo/blob/master/test.ipynb#sec",
+            "http://www.github.com/username/repo/tree/b/d/test.ipynb?x=1",
+        ]
+        for link in utils.classify_links(urls):
+            assert utils.is_github_jupyter_url(link.url)
+            assert link.path == utils.get_notebook_path(link.url)
+            repo, branch, filepath = utils.get_github_info(link.url)
+            assert (link.repo, link.branch, link.filepath) == (
+                repo,
+                branch,
+                filepath,
+            )
+
+    def test_raw(self):
+        url = "https://raw.githubusercontent.com/username/repo/dev/a/b.ipynb"
+        (link,) = utils.classify_links([url])
+        assert link.host == "raw.githubusercontent.com"
+        assert link.repo == "username/repo"
+        assert link.branch == "dev"
+        assert link.filepath == "a/b.ipynb"
+
+    def test_gist(self):
+        rev = "0123456789abcdef0123456789abcdef01234567"
+        url = "https://gist.githubusercontent.com/username/f00/raw/{}/n.ipynb"
+        (link,) = utils.classify_links([url.format(rev)])
+        assert link.host == "gist.githubusercontent.com"
+        assert link.repo == "username/f00"
+        assert link.branch == rev
+        assert link.filepath == "n.ipynb"
+
+    def test_non_notebooks(self):
+        urls = [
+            "http://github.com",
+            "https://github.com/username/repo",
+            "www.example.com/test.ipynb",
+            "https://example.com/test.ipynb",
+            "http://google.com",
+        ]
+        assert utils.classify_links(urls) == []
+
+    def test_dedupe(self):
+        url = "https://github.com/username/repo/test.ipynb"
+        links = utils.classify_links([url, "http://google.com", url])
+        assert [link.url for link in links] == [url]
+
+
+class TestGetNotebookLinks:
+    def test_many_bodies(self):
+        bodies = [
+            "<a href=http://www.example.com> "
+            "<a href=https://github.com/username/repo/a.ipynb>",
+            "<a href=https://github.com/username/repo/b.ipynb>",
+        ]
+        links = utils.get_notebook_links(bodies)
+        assert [link.url for link in links] == [
+            "https://github.com/username/repo/a.ipynb",
+            "https://github.com/username/repo/b.ipynb",
+        ]
+
+
+class TestThrottleStream:
+    def test_waits_on_pause(self):
+        class Event:
+            waits = []
+
+            def wait(self, timeout):
+                self.waits.append(timeout)
+
+        event = Event()
+        stream = utils.throttle_stream(iter([1, None, 2, None]), 5, event)
+        assert list(stream) == [1, None, 2, None]
+        assert event.waits == [5, 5]
+
+    def test_busy_stream_polled_sooner(self, caplog):
+        class Event:
+            waits = []
+
+            def wait(self, timeout):
+                self.waits.append(timeout)
+
+        event = Event()
+        # initial backlog, then a full page in one wait, then a quiet one
+        items = [0] * 100 + [None] + [1] * 200 + [None] + [2] + [None]
+        stream = utils.throttle_stream(iter(items), 300, event, name="Slow")
+        with caplog.at_level(logging.WARNING, logger="nbviewerbot"):
+            assert list(stream) == items
+        first, busy, quiet = event.waits
+        assert first == 300
+        # half a page per wait, at 200 items per ~300s
+        assert busy == pytest.approx(75, rel=0.01)
+        assert quiet == 300
+        assert "Slow stream got 200 items" in caplog.text
+
+
+def test_skip_seen():
+    Created = namedtuple("Created", ["fullname", "created_utc"])
+    stream = iter(
+        [
+            Created("t1_a", 1),
+            Created("t1_b", 5),
+            Created("t1_c", 5),
+            None,
+            Created("t1_d", 10),
+            Created("t1_e", 4),
+        ]
+    )
+    skipped = utils.skip_seen(stream, 5, ["t1_b"])
+    assert list(skipped) == [Created("t1_c", 5), None, Created("t1_d", 10)]
+
+
+class TestSetupLogger:
+    def test_no_duplicate_handlers(self):
+        for _ in range(3):
+            logger = utils.setup_logger(logging.INFO, None)
+        assert len(logger.handlers) == 1
+
+        logger = utils.setup_logger(None, None)
+        assert logger.handlers == []
+
+
+class TestLoadQueue:
+    def test_tags_items(self):
+        q = queue.Queue()
+        stop_event = threading.Event()
+        m = StreamMonitor("Comment", stalled_stream)
+
+        def items():
+            yield "a"
+            yield "b"
+            stop_event.set()
+            yield None
+
+        utils.load_queue(q, items(), stop_event, m)
+        queued = [q.get_nowait(), q.get_nowait()]
+        assert [i.obj for i in queued] == ["a", "b"]
+        assert {i.stream for i in queued} == {"Comment"}
+        assert m.items == 2
+
+    def test_restarts_stalled_stream(self):
+        q = queue.Queue()
+        stop_event = threading.Event()
+        m = StreamMonitor("Comment", lambda: itertools.chain("xy", [None]))
+
+        def stalled():
+            m.request_restart()
+            while True:
+                yield None
+
+        thread = threading.Thread(
+            target=utils.load_queue, args=(q, stalled(), stop_event, m)
+        )
+        thread.start()
+        try:
+            assert q.get(timeout=5).obj == "x"
+            assert q.get(timeout=5).obj == "y"
+        finally:
+            stop_event.set()
+            thread.join()
+        assert m.restarts == 1
+
+    def test_filters_subreddits(self):
+        q = queue.Queue()
+        stop_event = threading.Event()
+        subreddit_filter = SubredditFilter(["Python", "jupyter"], ["jupyter"])
+
+        def items():
+            for sub in ["python", "jupyter", "pics", "python"]:
+                yield Item(sub)
+            stop_event.set()
+            yield None
+
+        utils.load_queue(q, items(), stop_event, None, subreddit_filter)
+        assert q.qsize() == 2
+        assert q.get_nowait().obj.subreddit == "python"
+
+
+class TestGetAllLinksLimits:
+    LINK = "<a href=https://github.com/username/repo/test.ipynb>nb</a>"
+
+    def huge_body(self, n_bytes=4 * 1024 * 1024):
+        """A multi-megabyte body of table rows, like a pasted log"""
+        row = "<tr><td>2019-08-25 13:26:43</td><td>INFO</td></tr>\n"
+        return "<table>" + row * (n_bytes // len(row)) + "</table>"
+
+    def test_size_limit(self):
+        utils.PARSE_LIMITS_HIT.clear()
+        html = self.LINK + self.huge_body() + self.LINK.replace("test", "end")
+        links = utils.get_all_links(html, max_size=64 * 1024)
+        assert links == ["https://github.com/username/repo/test.ipynb"]
+        assert utils.PARSE_LIMITS_HIT["size"] == 1
+
+    def test_under_limits(self):
+        utils.PARSE_LIMITS_HIT.clear()
+        html = self.LINK + self.huge_body(1024 * 1024) + self.LINK
+        links = utils.get_all_links(html, max_size=2 * 1024 * 1024)
+        assert len(links) == 2
+        assert not utils.PARSE_LIMITS_HIT
+
+    def test_link_limit(self):
+        utils.PARSE_LIMITS_HIT.clear()
+        html = self.LINK * 100000
+        links = utils.get_all_links(html, max_size=len(html), max_links=10)
+        assert len(links) == 10
+        assert utils.PARSE_LIMITS_HIT["links"] == 1
+
+    def test_time_budget(self):
+        utils.PARSE_LIMITS_HIT.clear()
+        html = "<a href=#anchor>x</a>" * 1000000 + self.LINK
+        start = time.monotonic()
+        links = utils.get_all_links(html, max_size=len(html), time_budget=0.1)
+        assert time.monotonic() - start < 1
+        assert links == []
+        assert utils.PARSE_LIMITS_HIT["time"] == 1
+
+    def test_skips_non_link_markup_fast(self):
+        utils.PARSE_LIMITS_HIT.clear()
+        html = self.huge_body(16 * 1024 * 1024) + self.LINK
+        start = time.monotonic()
+        links = utils.get_all_links(html, max_size=len(html))
+        assert time.monotonic() - start < 0.5
+        assert len(links) == 1
+        assert not utils.PARSE_LIMITS_HIT
+
+    def test_unterminated_tags_fast(self):
+        # every "<a " starts a match attempt that used to scan to the end
+        utils.PARSE_LIMITS_HIT.clear()
+        html = "<a " * 60000 + self.LINK
+        start = time.monotonic()
+        links = utils.get_all_links(html)
+        assert time.monotonic() - start < 0.5
+        assert links == ["https://github.com/username/repo/test.ipynb"]
+
+    def test_cut_tag_keeps_later_links(self):
+        # the regex cuts the first tag at the ">" in its title
+        html = (
+            '<a href="https://x.org/a" title="x>y">z</a>'
+            '<a href="https://github.com/u/r/blob/master/x.ipynb">n</a>'
+        )
+        links = utils.get_all_links(html)
+        assert links[-1] == "https://github.com/u/r/blob/master/x.ipynb"